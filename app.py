@@ -1,14 +1,24 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, request, jsonify, render_template, send_from_directory, Response, g
 import os
 import json
-import cv2
-import numpy as np
 import base64
+import hashlib
 from werkzeug.utils import secure_filename
 import zipfile
 from datetime import datetime
 from pathlib import Path
 import shutil
+import uuid
+
+import threading
+
+from config import (PROFILE_SAMPLE_RATE, PROFILE_DIR, WARM_UP_ON_START, MODEL_CACHE_SIZE,
+                    TTA_VIEWS, TTA_AGGREGATION, PREDICT_BATCH_MAX)
+from utils.metrics import (PREDICT_STAGE_SECONDS, PREDICT_REQUESTS, PREDICT_ERRORS,
+                           PREDICT_IN_FLIGHT, MODEL_VERSION_LATENCY_SECONDS,
+                           MODEL_VERSION_PREDICTIONS, MODEL_VERSION_AGREEMENT,
+                           RequestProfiler, render_metrics)
+from utils.model_store import write_config, version_classes, config_lock, served_model_path
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max upload
@@ -21,6 +31,18 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['MODEL_FOLDER'], exist_ok=True)
 os.makedirs('projects', exist_ok=True)
 
+profiler = RequestProfiler(PROFILE_SAMPLE_RATE, PROFILE_DIR)
+
+@app.before_request
+def start_profiler():
+    g.profiler = profiler.start()
+
+@app.teardown_request
+def stop_profiler(exc=None):
+    active = g.pop('profiler', None)
+    if active is not None:
+        profiler.stop(active, request.endpoint or 'unknown')
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
@@ -30,13 +52,55 @@ def get_projects():
     if os.path.exists('projects'):
         for project_dir in os.listdir('projects'):
             project_path = os.path.join('projects', project_dir)
-            if os.path.isdir(project_path):
+            # Dot directories are imports in progress and deleted projects
+            if os.path.isdir(project_path) and not project_dir.startswith('.'):
                 config_file = os.path.join(project_path, 'config.json')
                 if os.path.exists(config_file):
                     with open(config_file, 'r') as f:
                         projects.append(json.load(f))
     return projects
 
+_readiness = {"ready": not WARM_UP_ON_START, "warmed_models": 0}
+
+def warm_up_models():
+    """
+    Import the inference stack and load the models of trained projects
+    (up to MODEL_CACHE_SIZE) into the predictor cache.
+
+    Called in a background thread at startup when WARM_UP_ON_START is set;
+    process managers can also call it directly from a post-fork hook.
+    /api/health reports ready once it has finished.
+    """
+    from utils.predictor import warm_up
+    
+    warmed = 0
+    for project in get_projects():
+        if warmed >= MODEL_CACHE_SIZE:
+            break
+        model_path = served_model_path(os.path.join('projects', project['name']), project)
+        if project.get('trained') and os.path.exists(model_path):
+            try:
+                warm_up(model_path, len(project['classes']))
+                warmed += 1
+            except Exception as e:
+                app.logger.warning(f"Warm-up failed for {project['name']}: {e}")
+    
+    _readiness['warmed_models'] = warmed
+    _readiness['ready'] = True
+
+if WARM_UP_ON_START:
+    threading.Thread(target=warm_up_models, daemon=True).start()
+
+def _remove_in_background(path):
+    """Delete a directory tree without blocking the request"""
+    threading.Thread(target=shutil.rmtree, args=(path,), kwargs={'ignore_errors': True},
+                     daemon=True).start()
+
+# Finish deletions interrupted by a restart
+for _entry in os.listdir('projects'):
+    if _entry.startswith('.deleted-'):
+        _remove_in_background(os.path.join('projects', _entry))
+
 @app.route('/')
 def home():
     """Main landing page"""
@@ -126,6 +190,10 @@ def upload_dataset():
     
     dataset_dir = os.path.join(project_dir, 'dataset')
     
+    # Unlabeled images go to the pool, to be ranked for labeling
+    to_pool = request.form.get('destination') == 'pool'
+    target_dir = os.path.join(project_dir, 'pool') if to_pool else dataset_dir
+    
     # Handle zip file upload
     if file.filename.endswith('.zip'):
         zip_path = os.path.join(project_dir, 'temp.zip')
@@ -133,30 +201,49 @@ def upload_dataset():
         
         try:
             with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(dataset_dir)
+                zip_ref.extractall(target_dir)
             os.remove(zip_path)
         except Exception as e:
             return jsonify({"error": f"Failed to extract zip: {str(e)}"}), 400
+    elif to_pool:
+        os.makedirs(target_dir, exist_ok=True)
+        file.save(_unique_path(target_dir, secure_filename(file.filename)))
     else:
         # Handle individual image upload
         class_name = request.form.get('class_name', 'default')
         class_dir = os.path.join(dataset_dir, class_name)
         os.makedirs(class_dir, exist_ok=True)
         
-        filename = secure_filename(file.filename)
-        file.save(os.path.join(class_dir, filename))
+        file.save(_unique_path(class_dir, secure_filename(file.filename)))
+    
+    if to_pool:
+        config_path = os.path.join(project_dir, 'config.json')
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        
+        response = {"success": True, "pool": True}
+        if config.get('trained'):
+            # Rank the new images right away; already scored ones are skipped
+            process = _start_pool_scoring(project_name)
+            response['process_id'] = process.pid if process else None
+        return jsonify(response)
+    
+    classes, class_counts = _refresh_class_counts(project_dir)
+    return jsonify({"success": True, "classes": classes, "class_counts": class_counts})
+
+def _refresh_class_counts(project_dir):
+    """
+    Record the dataset's classes and images per class in config.json.
+    
+    Returns:
+        tuple: (classes, class_counts)
+    """
+    dataset_dir = os.path.join(project_dir, 'dataset')
     
     # Update project config with classes
     classes = [d for d in os.listdir(dataset_dir) 
                if os.path.isdir(os.path.join(dataset_dir, d)) and not d.startswith('.')]
     
-    config_path = os.path.join(project_dir, 'config.json')
-    with open(config_path, 'r') as f:
-        config = json.load(f)
-    
-    config['classes'] = sorted(classes)
-    config['num_classes'] = len(classes)
-    
     # Count images per class
     class_counts = {}
     for class_name in classes:
@@ -165,12 +252,33 @@ def upload_dataset():
                     if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp'))])
         class_counts[class_name] = count
     
-    config['class_counts'] = class_counts
+    config_path = os.path.join(project_dir, 'config.json')
+    with config_lock(project_dir):
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        
+        config['classes'] = sorted(classes)
+        config['num_classes'] = len(classes)
+        config['class_counts'] = class_counts
+        
+        write_config(project_dir, config)
     
-    with open(config_path, 'w') as f:
-        json.dump(config, f, indent=2)
+    # Keep an existing similarity index in step with the dataset
+    if config.get('trained') and os.path.exists(os.path.join(project_dir, 'index', 'meta.json')):
+        threading.Thread(target=_update_similarity_index,
+                         args=(project_dir, config), daemon=True).start()
     
-    return jsonify({"success": True, "classes": classes, "class_counts": class_counts})
+    return classes, class_counts
+
+def _update_similarity_index(project_dir, config):
+    from utils.embeddings import update_index
+    from utils.predictor import get_model
+    
+    model_path = served_model_path(project_dir, config)
+    try:
+        update_index(project_dir, get_model(model_path, len(config['classes'])), model_path)
+    except Exception as e:
+        app.logger.warning(f"Similarity index update failed for {project_dir}: {e}")
 
 @app.route('/api/train', methods=['POST'])
 def train_model():
@@ -203,6 +311,12 @@ def train_model():
         '--batch_size', str(batch_size),
         '--learning_rate', str(learning_rate)
     ]
+    if data.get('promote') is False:
+        # Keep serving the current model; the new version can be tried as canary or shadow
+        cmd.append('--no_promote')
+    if data.get('balanced'):
+        # Oversample small classes using the tracked class counts
+        cmd.append('--balanced')
     
     try:
         # Start training in background
@@ -215,58 +329,762 @@ def train_model():
     except Exception as e:
         return jsonify({"error": f"Failed to start training: {str(e)}"}), 500
 
+@app.route('/api/sweep', methods=['POST'])
+def sweep_model():
+    """API: Tune hyperparameters for a project and promote the best model"""
+    data = request.json
+    project_name = data.get('project_name')
+    
+    if not project_name:
+        return jsonify({"error": "Project name is required"}), 400
+    
+    project_dir = os.path.join('projects', project_name)
+    if not os.path.exists(project_dir):
+        return jsonify({"error": "Project not found"}), 404
+    
+    strategy = data.get('strategy', 'random')
+    if strategy not in ('grid', 'random'):
+        return jsonify({"error": "Strategy must be 'grid' or 'random'"}), 400
+    
+    import subprocess
+    import sys
+    from scripts.sweep import MAX_TRIALS, plan_trials
+    
+    # Clients may lower the server's limits but never raise them
+    cpu_count = os.cpu_count() or 1
+    try:
+        trials = int(data.get('trials', 10))
+        max_trials = min(int(data.get('max_trials') or MAX_TRIALS), MAX_TRIALS)
+        threads_per_trial = min(int(data.get('threads_per_trial', 1)), cpu_count)
+        cpu_budget = min(int(data.get('cpu_budget') or cpu_count), cpu_count)
+        if threads_per_trial < 1 or cpu_budget < 1:
+            raise ValueError("threads_per_trial and cpu_budget must be at least 1")
+        # Refuse oversized sweeps here rather than in the background process
+        plan_trials(strategy, trials, data.get('space'), max_trials=max_trials)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid sweep: {str(e)}"}), 400
+    
+    cmd = [
+        sys.executable,
+        'scripts/sweep.py',
+        '--project', project_name,
+        '--strategy', strategy,
+        '--trials', str(trials),
+        '--max_trials', str(max_trials),
+        '--threads_per_trial', str(threads_per_trial),
+        '--cpu_budget', str(cpu_budget)
+    ]
+    if data.get('space'):
+        cmd += ['--space', json.dumps(data['space'])]
+    if data.get('prune') is False:
+        cmd.append('--no_prune')
+    
+    try:
+        # Start the sweep in background; its output is appended to sweeps/sweep.log
+        sweeps_dir = os.path.join(project_dir, 'sweeps')
+        os.makedirs(sweeps_dir, exist_ok=True)
+        with open(os.path.join(sweeps_dir, 'sweep.log'), 'ab') as log:
+            process = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+        return jsonify({
+            "success": True,
+            "message": "Sweep started",
+            "process_id": process.pid
+        })
+    except Exception as e:
+        return jsonify({"error": f"Failed to start sweep: {str(e)}"}), 500
+
 @app.route('/api/predict', methods=['POST'])
 def predict():
     """API: Make prediction using trained model"""
+    with PREDICT_IN_FLIGHT.track():
+        return _predict()
+
+def _parse_flag(value):
+    return bool(value) and value.lower() in ('1', 'true', 'yes')
+
+def _parse_tta(value):
+    """Turn the tta form field into a list of view names, or None"""
+    if not value or value.lower() in ('0', 'false', 'no'):
+        return None
+    if value.lower() in ('1', 'true', 'yes'):
+        return list(TTA_VIEWS)
+    return [view.strip() for view in value.split(',') if view.strip()]
+
+def _fail_prediction(message, status, reason, project=''):
+    """Count a failed prediction request and build its error response"""
+    PREDICT_ERRORS.inc(project=project, reason=reason)
+    return jsonify({"error": message}), status
+
+def _start_prediction(backend, form_parse_seconds):
+    """
+    Count a prediction request and record its form_parse stage.
+
+    Returns:
+        tuple: (project_name, project label for metrics, config path or None)
+    """
     project_name = request.form.get('project_name')
+    config_path = None
+    if project_name:
+        config_path = os.path.join('projects', project_name, 'config.json')
+        if not os.path.exists(config_path):
+            config_path = None
+    # Unknown projects are counted unlabelled, so clients cannot create label values
+    project = project_name if config_path else ''
+    PREDICT_REQUESTS.inc(project=project)
+    PREDICT_STAGE_SECONDS.observe(form_parse_seconds, stage='form_parse', project=project,
+                                  backend=backend)
+    return project_name, project, config_path
+
+def _predict():
+    import time
+    import cv2
+    import numpy as np
+    from utils.predictor import get_device, AVAILABLE_TTA_VIEWS, AVAILABLE_TTA_AGGREGATIONS
+    
+    backend = get_device().type
+    fail = _fail_prediction
+    
+    def stage(name, project=''):
+        return PREDICT_STAGE_SECONDS.time(stage=name, project=project, backend=backend)
+    
+    # Parsed once (the first access reads the whole multipart body); every
+    # request is counted before any error so errors never exceed requests
+    start = time.perf_counter()
+    file = request.files.get('image')
+    image_data = request.form.get('image_data')
+    project_name, project, config_path = _start_prediction(backend, time.perf_counter() - start)
     
     if not project_name:
-        return jsonify({"error": "Project name is required"}), 400
+        return fail("Project name is required", 400, 'bad_request')
+    if not config_path:
+        return fail("Project not found", 404, 'not_found')
+    
+    project_dir = os.path.join('projects', project_name)
+    
+    with stage('config_read', project_name):
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+    
+    if not config.get('trained'):
+        return fail("Model not trained yet", 400, 'not_trained', project_name)
+    
+    if file is not None:
+        image_bytes = file.read()
+    elif image_data is not None:
+        # Base64 encoded image
+        with stage('base64_decode', project_name):
+            image_bytes = base64.b64decode(image_data.split(',')[1])
+    else:
+        return fail("No image provided", 400, 'bad_request', project_name)
+    
+    with stage('imdecode', project_name):
+        np_arr = np.frombuffer(image_bytes, np.uint8)
+        img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+    
+    if img is None:
+        return fail("Could not decode image", 400, 'bad_image', project_name)
+    
+    # Test-time augmentation: tta=1 uses TTA_VIEWS, or a comma-separated list of views
+    tta = _parse_tta(request.form.get('tta'))
+    aggregation = request.form.get('tta_aggregation') or TTA_AGGREGATION
+    if tta and (set(tta) - set(AVAILABLE_TTA_VIEWS) or aggregation not in AVAILABLE_TTA_AGGREGATIONS):
+        return fail(f"Invalid TTA options; views: {', '.join(AVAILABLE_TTA_VIEWS)}, "
+                    f"aggregation: {', '.join(AVAILABLE_TTA_AGGREGATIONS)}",
+                    400, 'bad_request', project_name)
+    
+    # Grad-CAM heatmaps are cached by image content and model
+    explain = _parse_flag(request.form.get('explain'))
+    image_key = hashlib.sha256(image_bytes).hexdigest() if explain else None
+    
+    # Load model(s) and make prediction according to the project's serving policy
+    try:
+        result = _serve_prediction(project_dir, project_name, config, img, tta, aggregation,
+                                   image_key)
+        if tta:
+            result["tta"] = {"views": list(tta), "aggregation": aggregation}
+        return jsonify(result)
+    except Exception as e:
+        return fail(f"Prediction failed: {str(e)}", 500, 'exception', project_name)
+
+@app.route('/api/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    API: Predict on several uploaded images (form field 'images') with the
+    promoted model in one forward pass; explain=1 adds Grad-CAM heatmaps
+    """
+    with PREDICT_IN_FLIGHT.track():
+        return _predict_batch()
+
+def _predict_batch():
+    import io
+    import time
+    from PIL import Image
+    from utils.predictor import (get_device, predict_batch as predict_images, explain_batch,
+                                 encode_heatmap)
+    
+    backend = get_device().type
+    fail = _fail_prediction
+    
+    def stage(name, project=''):
+        return PREDICT_STAGE_SECONDS.time(stage=name, project=project, backend=backend)
+    
+    start = time.perf_counter()
+    files = request.files.getlist('images')
+    project_name, project, config_path = _start_prediction(backend, time.perf_counter() - start)
+    
+    if not project_name:
+        return fail("Project name is required", 400, 'bad_request')
+    if not config_path:
+        return fail("Project not found", 404, 'not_found')
+    
+    project_dir = os.path.join('projects', project_name)
+    
+    with stage('config_read', project_name):
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+    
+    if not config.get('trained'):
+        return fail("Model not trained yet", 400, 'not_trained', project_name)
+    
+    if not files:
+        return fail("No images provided", 400, 'bad_request', project_name)
+    if len(files) > PREDICT_BATCH_MAX:
+        return fail(f"At most {PREDICT_BATCH_MAX} images per request", 400, 'bad_request', project_name)
+    
+    images, keys = [], []
+    with stage('imdecode', project_name):
+        for file in files:
+            image_bytes = file.read()
+            try:
+                images.append(Image.open(io.BytesIO(image_bytes)).convert('RGB'))
+            except Exception:
+                return fail(f"Could not decode image: {file.filename}", 400, 'bad_image', project_name)
+            keys.append(hashlib.sha256(image_bytes).hexdigest())
+    
+    class_labels = config['classes']
+    model_path = served_model_path(project_dir, config)
+    explain = _parse_flag(request.form.get('explain'))
+    
+    try:
+        # One stage for the whole batch, including model load and preprocessing
+        with stage('explain' if explain else 'forward', project_name):
+            if explain:
+                outputs = explain_batch(images, model_path, len(class_labels), keys)
+            else:
+                outputs = [(probs, None) for probs in predict_images(images, model_path, len(class_labels))]
+    except Exception as e:
+        return fail(f"Prediction failed: {str(e)}", 500, 'exception', project_name)
+    
+    results = []
+    for file, (probs, heatmap) in zip(files, outputs):
+        result = {
+            "filename": file.filename,
+            "prediction": class_labels[int(probs.argmax())],
+            "confidence": float(probs.max()),
+            "all_probabilities": {class_name: float(prob)
+                                  for class_name, prob in zip(class_labels, probs)}
+        }
+        if heatmap is not None:
+            result["heatmap"] = encode_heatmap(heatmap)
+        results.append(result)
+    
+    return jsonify({
+        "model_version": config.get('model_version') or 'current',
+        "heatmap_layer": "conv3" if explain else None,
+        "results": results
+    })
+
+def _record_version(project_name, version, role, seconds):
+    MODEL_VERSION_LATENCY_SECONDS.observe(seconds, project=project_name, version=version, role=role)
+    MODEL_VERSION_PREDICTIONS.inc(project=project_name, version=version, role=role)
+
+def _serve_prediction(project_dir, project_name, config, img, tta, aggregation, image_key=None):
+    """
+    Predict with the promoted model, a canary candidate or an ensemble of
+    versions, and mirror shadow traffic to a candidate in the background.
+    
+    With an image_key the prediction is also explained with a Grad-CAM
+    heatmap. A plain prediction computes it in the same forward pass; with
+    TTA or an ensemble the served class is explained with one extra pass of
+    the first model.
+    """
+    import random
+    import time
+    from utils.predictor import predict_image, predict_ensemble, explain_image, encode_heatmap
+    from utils.model_store import version_model_path
+    
+    serving = config.get('serving') or {}
+    primary = config.get('model_version') or 'current'
+    class_labels = config['classes']
+    candidate = serving.get('candidate')
+    mode = serving.get('mode', 'off')
+    
+    if serving.get('ensemble'):
+        versions = serving['ensemble']
+        model_paths = {v: version_model_path(project_dir, v) for v in versions}
+        prediction, confidence, per_version = predict_ensemble(
+            img, model_paths, class_labels, project=project_name, tta=tta, aggregation=aggregation)
+        model_path = model_paths[versions[0]]
+        for version, (probs, seconds) in per_version.items():
+            _record_version(project_name, version, 'ensemble', seconds)
+            agree = class_labels[int(probs.argmax())] == prediction
+            MODEL_VERSION_AGREEMENT.inc(project=project_name, version=version, agree=str(agree).lower())
+        served_version = 'ensemble'
+    else:
+        served_version, role = primary, 'primary'
+        model_path = served_model_path(project_dir, config)
+        if mode == 'canary' and candidate and random.random() * 100 < serving.get('percent', 0):
+            served_version, role = candidate, 'canary'
+            model_path = version_model_path(project_dir, candidate)
+            class_labels = version_classes(project_dir, candidate)
+        
+        start = time.perf_counter()
+        if image_key and not tta:
+            prediction, confidence, heatmap = explain_image(img, model_path, class_labels,
+                                                            project=project_name, image_key=image_key)
+        else:
+            prediction, confidence = predict_image(img, model_path, class_labels, project=project_name,
+                                                   tta=tta, aggregation=aggregation)
+        _record_version(project_name, served_version, role, time.perf_counter() - start)
+        
+        if mode == 'shadow' and candidate:
+            _shadow_executor().submit(_shadow_predict, project_dir, project_name, candidate,
+                                      img, prediction, tta, aggregation)
+    
+    result = {
+        "prediction": prediction,
+        "confidence": float(confidence.max()),
+        "model_version": served_version,
+        "all_probabilities": {class_name: float(prob) 
+                             for class_name, prob in zip(class_labels, confidence)}
+    }
+    
+    if image_key:
+        if tta or serving.get('ensemble'):
+            _, _, heatmap = explain_image(img, model_path, class_labels, project=project_name,
+                                          image_key=image_key,
+                                          target_class=class_labels.index(prediction))
+        result["heatmap"] = encode_heatmap(heatmap)
+        result["heatmap_layer"] = "conv3"
+    
+    return result
+
+_shadow_pool = None
+_shadow_pool_lock = threading.Lock()
+
+def _shadow_executor():
+    global _shadow_pool
+    with _shadow_pool_lock:
+        if _shadow_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _shadow_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='shadow')
+    return _shadow_pool
+
+def _shadow_predict(project_dir, project_name, version, img, served_prediction, tta, aggregation):
+    """Run a shadow version off the request path and record whether it agreed"""
+    import time
+    from utils.predictor import predict_image
+    from utils.model_store import version_model_path
+    
+    try:
+        start = time.perf_counter()
+        prediction, _ = predict_image(img, version_model_path(project_dir, version),
+                                      version_classes(project_dir, version),
+                                      project=project_name, tta=tta, aggregation=aggregation)
+        _record_version(project_name, version, 'shadow', time.perf_counter() - start)
+        agree = prediction == served_prediction
+        MODEL_VERSION_AGREEMENT.inc(project=project_name, version=version, agree=str(agree).lower())
+    except Exception as e:
+        app.logger.warning(f"Shadow prediction with {version} failed for {project_name}: {e}")
+
+@app.route('/api/projects/<project_name>/versions', methods=['GET'])
+def list_model_versions(project_name):
+    """API: List stored model versions and the serving policy"""
+    from utils.model_store import list_versions, current_version
+    
+    project_dir = os.path.join('projects', project_name)
+    config_path = os.path.join(project_dir, 'config.json')
+    if not os.path.exists(config_path):
+        return jsonify({"error": "Project not found"}), 404
+    
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    
+    return jsonify({
+        "current": current_version(project_dir),
+        "versions": list_versions(project_dir),
+        "serving": config.get('serving') or {"mode": "off"}
+    })
+
+@app.route('/api/projects/<project_name>/promote', methods=['POST'])
+def promote_model_version(project_name):
+    """API: Atomically serve a stored model version"""
+    from utils.model_store import promote, is_version
+    
+    project_dir = os.path.join('projects', project_name)
+    config_path = os.path.join(project_dir, 'config.json')
+    if not os.path.exists(config_path):
+        return jsonify({"error": "Project not found"}), 404
+    
+    version = (request.json or {}).get('version')
+    if not version:
+        return jsonify({"error": "Version is required"}), 400
+    if not is_version(project_dir, version):
+        return jsonify({"error": f"Unknown model version: {version}"}), 404
+    
+    try:
+        promote(project_dir, version)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    
+    return jsonify({"success": True, "model_version": version})
+
+@app.route('/api/projects/<project_name>/serving', methods=['POST'])
+def set_serving_policy(project_name):
+    """API: Route traffic to a candidate version (canary/shadow) or serve an ensemble"""
+    from utils.model_store import is_version
     
     project_dir = os.path.join('projects', project_name)
     config_path = os.path.join(project_dir, 'config.json')
+    if not os.path.exists(config_path):
+        return jsonify({"error": "Project not found"}), 404
+    
+    data = request.json or {}
+    mode = data.get('mode', 'off')
+    candidate = data.get('candidate')
+    ensemble = data.get('ensemble') or []
+    if not isinstance(ensemble, list):
+        return jsonify({"error": "Ensemble must be a list of versions"}), 400
+    
+    if mode not in ('off', 'canary', 'shadow'):
+        return jsonify({"error": "Mode must be 'off', 'canary' or 'shadow'"}), 400
+    if mode != 'off' and not candidate:
+        return jsonify({"error": "A candidate version is required for canary and shadow modes"}), 400
+    
+    try:
+        percent = float(data.get('percent', 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Percent must be a number"}), 400
+    if not 0 <= percent <= 100:
+        return jsonify({"error": "Percent must be between 0 and 100"}), 400
+    
+    for version in ([candidate] if candidate else []) + ensemble:
+        if not is_version(project_dir, version):
+            return jsonify({"error": f"Unknown model version: {version}"}), 404
+    
+    with config_lock(project_dir):
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        
+        if any(version_classes(project_dir, v) != config['classes'] for v in ensemble):
+            return jsonify({"error": "Ensemble versions must share the project's classes"}), 400
+        
+        config['serving'] = {
+            "mode": mode,
+            "candidate": candidate,
+            "percent": percent,
+            "ensemble": ensemble
+        }
+        
+        write_config(project_dir, config)
+    
+    return jsonify({"success": True, "serving": config['serving']})
+
+@app.route('/api/index', methods=['POST'])
+def build_similarity_index():
+    """API: Build the similarity-search index of a project"""
+    data = request.json
+    project_name = data.get('project_name')
+    
+    if not project_name:
+        return jsonify({"error": "Project name is required"}), 400
+    
+    project_dir = os.path.join('projects', project_name)
+    if not os.path.exists(project_dir):
+        return jsonify({"error": "Project not found"}), 404
+    
+    import subprocess
+    import sys
+    
+    cmd = [
+        sys.executable,
+        'scripts/build_index.py',
+        '--project', project_name
+    ]
+    if data.get('approximate'):
+        cmd.append('--approximate')
+    
+    try:
+        # Start indexing in background; its output is appended to index/build.log
+        index_dir = os.path.join(project_dir, 'index')
+        os.makedirs(index_dir, exist_ok=True)
+        with open(os.path.join(index_dir, 'build.log'), 'ab') as log:
+            process = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+        return jsonify({
+            "success": True,
+            "message": "Indexing started",
+            "process_id": process.pid
+        })
+    except Exception as e:
+        return jsonify({"error": f"Failed to start indexing: {str(e)}"}), 500
+
+@app.route('/api/similar', methods=['POST'])
+def similar_images():
+    """API: Find the dataset images most similar to an uploaded image"""
+    import cv2
+    import numpy as np
+    import torch
+    from utils.embeddings import query_index
+    from utils.predictor import get_model, preprocess
     
+    project_name = request.form.get('project_name')
+    if not project_name:
+        return jsonify({"error": "Project name is required"}), 400
+    
+    project_dir = os.path.join('projects', project_name)
+    config_path = os.path.join(project_dir, 'config.json')
     if not os.path.exists(config_path):
         return jsonify({"error": "Project not found"}), 404
     
     with open(config_path, 'r') as f:
         config = json.load(f)
     
-    if not config.get('trained'):
-        return jsonify({"error": "Model not trained yet"}), 400
+    if not os.path.exists(os.path.join(project_dir, 'index', 'meta.json')):
+        return jsonify({"error": "Project has no similarity index yet"}), 400
     
-    # Get image from request
     if 'image' in request.files:
-        file = request.files['image']
-        image_bytes = file.read()
-        np_arr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        image_bytes = request.files['image'].read()
     elif 'image_data' in request.form:
-        # Base64 encoded image
-        image_data = request.form['image_data']
-        image_decoded = base64.b64decode(image_data.split(',')[1])
-        np_arr = np.frombuffer(image_decoded, np.uint8)
-        img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        image_bytes = base64.b64decode(request.form['image_data'].split(',')[1])
     else:
         return jsonify({"error": "No image provided"}), 400
     
-    # Load model and make prediction
-    from utils.predictor import predict_image
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return jsonify({"error": "Could not decode image"}), 400
     
-    model_path = os.path.join(project_dir, 'models', 'model.pth')
-    class_labels = config['classes']
+    try:
+        k = int(request.form.get('k', 5))
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+    if k < 1:
+        return jsonify({"error": "k must be at least 1"}), 400
+    
+    # query_index caps k at the number of indexed images
+    model_path = served_model_path(project_dir, config)
     
     try:
-        prediction, confidence = predict_image(img, model_path, class_labels)
-        
+        model = get_model(model_path, len(config['classes']))
+        device = next(model.parameters()).device
+        with torch.no_grad():
+            embedding = model.embed(preprocess(img).to(device))[0].cpu().numpy()
+        return jsonify({"results": query_index(project_dir, embedding, k)})
+    except Exception as e:
+        return jsonify({"error": f"Similarity search failed: {str(e)}"}), 500
+
+@app.route('/api/health')
+def health():
+    """API: Readiness of this worker"""
+    return jsonify(_readiness), 200 if _readiness['ready'] else 503
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+def _start_pool_scoring(project_name, method=None):
+    """
+    Score a project's unlabeled pool in a background process.
+    
+    Returns:
+        The scoring process, or None if a scorer is already running on the
+        project; it was asked to score the pool again when it finishes
+    """
+    import subprocess
+    import sys
+    from utils.active_learning import scoring_lock, request_rescore, score_log_path
+    
+    project_dir = os.path.join('projects', project_name)
+    lock = scoring_lock(project_dir)
+    if not lock.acquire(blocking=False):
+        request_rescore(project_dir, method)
+        return None
+    lock.release()
+    
+    cmd = [
+        sys.executable,
+        'scripts/score_pool.py',
+        '--project', project_name
+    ]
+    if method:
+        cmd += ['--method', method]
+    # A scorer started meanwhile by another request makes this one hand over
+    # its pass and exit
+    os.makedirs(os.path.dirname(score_log_path(project_dir)), exist_ok=True)
+    with open(score_log_path(project_dir), 'ab') as log:
+        return subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+
+@app.route('/api/projects/<project_name>/pool/score', methods=['POST'])
+def score_pool(project_name):
+    """API: Rank the project's unlabeled pool by model uncertainty"""
+    from utils.active_learning import UNCERTAINTY_METHODS
+    
+    project_dir = os.path.join('projects', project_name)
+    config_path = os.path.join(project_dir, 'config.json')
+    if not os.path.exists(config_path):
+        return jsonify({"error": "Project not found"}), 404
+    
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    if not config.get('trained'):
+        return jsonify({"error": "Project has no trained model yet"}), 400
+    
+    method = (request.get_json(silent=True) or {}).get('method')
+    if method and method not in UNCERTAINTY_METHODS:
+        return jsonify({"error": f"Unknown uncertainty method: {method}"}), 400
+    
+    try:
+        process = _start_pool_scoring(project_name, method)
+        if process is None:
+            return jsonify({
+                "success": True,
+                "message": "Scoring already running; the pool will be scored again when it finishes",
+                "process_id": None
+            })
         return jsonify({
-            "prediction": prediction,
-            "confidence": float(confidence),
-            "all_probabilities": {class_name: float(prob) 
-                                 for class_name, prob in zip(class_labels, confidence)}
+            "success": True,
+            "message": "Scoring started",
+            "process_id": process.pid
         })
     except Exception as e:
-        return jsonify({"error": f"Prediction failed: {str(e)}"}), 500
+        return jsonify({"error": f"Failed to start scoring: {str(e)}"}), 500
+
+@app.route('/api/projects/<project_name>/pool/queue', methods=['GET'])
+def labeling_queue(project_name):
+    """API: Pool images ranked by how much labeling them should help"""
+    from utils.active_learning import read_queue
+    
+    project_dir = os.path.join('projects', project_name)
+    if not os.path.exists(os.path.join(project_dir, 'config.json')):
+        return jsonify({"error": "Project not found"}), 404
+    
+    queue = read_queue(project_dir)
+    if queue is None:
+        return jsonify({"method": None, "pool_size": 0, "scored": 0, "items": []})
+    return jsonify(queue)
+
+@app.route('/api/projects/<project_name>/pool/images/<path:filename>', methods=['GET'])
+def pool_image(project_name, filename):
+    """API: An image of the unlabeled pool"""
+    return send_from_directory(os.path.join('projects', project_name, 'pool'), filename)
+
+def _unique_path(directory, filename):
+    """Path for filename in directory, with a numeric suffix if the name is taken"""
+    stem, ext = os.path.splitext(filename)
+    path = os.path.join(directory, filename)
+    counter = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f"{stem}_{counter}{ext}")
+        counter += 1
+    return path
+
+@app.route('/api/projects/<project_name>/pool/label', methods=['POST'])
+def label_pool_image(project_name):
+    """API: Move a pool image into a class of the dataset"""
+    data = request.json
+    path = data.get('path', '')
+    class_name = secure_filename(data.get('class_name', '').strip())
+    
+    if not path or not class_name:
+        return jsonify({"error": "path and class_name are required"}), 400
+    
+    project_dir = os.path.join('projects', project_name)
+    if not os.path.exists(os.path.join(project_dir, 'config.json')):
+        return jsonify({"error": "Project not found"}), 404
+    
+    pool_dir = os.path.abspath(os.path.join(project_dir, 'pool'))
+    source = os.path.abspath(os.path.join(pool_dir, path))
+    if not source.startswith(pool_dir + os.sep) or not os.path.isfile(source):
+        return jsonify({"error": "Image not found in pool"}), 404
+    
+    class_dir = os.path.join(project_dir, 'dataset', class_name)
+    os.makedirs(class_dir, exist_ok=True)
+    os.replace(source, _unique_path(class_dir, secure_filename(os.path.basename(source))))
+    
+    classes, class_counts = _refresh_class_counts(project_dir)
+    return jsonify({"success": True, "classes": classes, "class_counts": class_counts})
+
+@app.route('/api/projects/<project_name>/export', methods=['GET'])
+def export_project_index(project_name):
+    """API: Shards of a project archive; each is downloaded from /export/<shard>"""
+    from utils.archive import plan_archive
+    
+    project_dir = os.path.join('projects', project_name)
+    if not os.path.exists(os.path.join(project_dir, 'config.json')):
+        return jsonify({"error": "Project not found"}), 404
+    
+    return jsonify(plan_archive(project_dir))
+
+@app.route('/api/projects/<project_name>/export/<int:shard>', methods=['GET'])
+def export_project_shard(project_name, shard):
+    """API: Stream one tar shard of a project archive"""
+    from utils.archive import plan_archive, iter_shard
+    
+    project_dir = os.path.join('projects', project_name)
+    if not os.path.exists(os.path.join(project_dir, 'config.json')):
+        return jsonify({"error": "Project not found"}), 404
+    
+    shards = plan_archive(project_dir)['shards']
+    if shard >= len(shards):
+        return jsonify({"error": f"Project has {len(shards)} shards"}), 404
+    
+    return Response(iter_shard(project_dir, shards[shard]['files']), mimetype='application/x-tar',
+                    headers={"Content-Disposition": f"attachment; filename={shards[shard]['name']}"})
+
+@app.route('/api/projects/<project_name>/export.tar', methods=['GET'])
+def export_project_archive(project_name):
+    """API: Stream every shard of a project archive, concatenated"""
+    from utils.archive import plan_archive, iter_shard
+    
+    project_dir = os.path.join('projects', project_name)
+    if not os.path.exists(os.path.join(project_dir, 'config.json')):
+        return jsonify({"error": "Project not found"}), 404
+    
+    def generate():
+        for shard in plan_archive(project_dir)['shards']:
+            yield from iter_shard(project_dir, shard['files'])
+    
+    return Response(generate(), mimetype='application/x-tar',
+                    headers={"Content-Disposition": f"attachment; filename={project_name}.tar"})
+
+@app.route('/api/projects/<project_name>/import', methods=['POST'])
+def import_project(project_name):
+    """
+    API: Create a project from archive shards streamed in the request body.
+    
+    The body is one or more concatenated shards. With ?append=true the
+    shards are added to an existing project, so archives larger than the
+    upload limit can be sent one shard per request.
+    """
+    import tarfile
+    from utils.archive import import_archive
+    
+    if not project_name or secure_filename(project_name) != project_name:
+        return jsonify({"error": "Invalid project name"}), 400
+    
+    project_dir = os.path.join('projects', project_name)
+    append = request.args.get('append') == 'true'
+    
+    try:
+        # Extracted while the body is read; nothing is buffered whole
+        import_archive([request.stream], project_dir, append=append)
+    except (ValueError, tarfile.ReadError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Failed to import project: {str(e)}"}), 500
+    
+    with open(os.path.join(project_dir, 'config.json'), 'r') as f:
+        return jsonify({"success": True, "project": json.load(f)})
 
 @app.route('/api/delete_project/<project_name>', methods=['DELETE'])
 def delete_project(project_name):
@@ -277,7 +1095,11 @@ def delete_project(project_name):
         return jsonify({"error": "Project not found"}), 404
     
     try:
-        shutil.rmtree(project_dir)
+        # Renaming is instant and hides the project; the files are removed in
+        # the background
+        trash_dir = os.path.join('projects', f".deleted-{project_name}-{uuid.uuid4().hex[:8]}")
+        os.rename(project_dir, trash_dir)
+        _remove_in_background(trash_dir)
         return jsonify({"success": True, "message": "Project deleted"})
     except Exception as e:
         return jsonify({"error": f"Failed to delete project: {str(e)}"}), 500
@@ -19,7 +19,7 @@ def list_projects():
     
     projects = []
     for project_dir in projects_dir.iterdir():
-        if project_dir.is_dir():
+        if project_dir.is_dir() and not project_dir.name.startswith('.'):
             config_file = project_dir / 'config.json'
             if config_file.exists():
                 with open(config_file, 'r') as f:
@@ -118,7 +118,7 @@ def create_project(name, description=""):
     print(f"  2. Organize images into class folders")
     print(f"  3. Run: python scripts/train_model.py --project {name}")
 
-def train_project(project_name, epochs=10):
+def train_project(project_name, epochs=10, procs=1, balanced=False):
     """Train a project model"""
     config_file = Path('projects') / project_name / 'config.json'
     
@@ -128,6 +128,10 @@ def train_project(project_name, epochs=10):
     
     print(f"Starting training for project: {project_name}")
     print(f"Epochs: {epochs}")
+    if procs > 1:
+        print(f"Processes: {procs}")
+    if balanced:
+        print("Sampling: class-balanced")
     print(f"\nTraining output:\n")
     
     import subprocess
@@ -135,8 +139,11 @@ def train_project(project_name, epochs=10):
         sys.executable,
         'scripts/train_model.py',
         '--project', project_name,
-        '--epochs', str(epochs)
+        '--epochs', str(epochs),
+        '--procs', str(procs)
     ]
+    if balanced:
+        cmd.append('--balanced')
     
     try:
         subprocess.run(cmd, check=True)
@@ -144,6 +151,156 @@ def train_project(project_name, epochs=10):
         print(f"\nError: Training failed with exit code {e.returncode}")
         sys.exit(1)
 
+def sweep_project(project_name, strategy='random', trials=10, cpu_budget=None, max_trials=None):
+    """Tune a project's hyperparameters and keep the best model"""
+    config_file = Path('projects') / project_name / 'config.json'
+    
+    if not config_file.exists():
+        print(f"Error: Project '{project_name}' not found!")
+        return
+    
+    import subprocess
+    cmd = [
+        sys.executable,
+        'scripts/sweep.py',
+        '--project', project_name,
+        '--strategy', strategy,
+        '--trials', str(trials)
+    ]
+    if cpu_budget:
+        cmd += ['--cpu_budget', str(cpu_budget)]
+    if max_trials:
+        cmd += ['--max_trials', str(max_trials)]
+    
+    try:
+        subprocess.run(cmd, check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"\nError: Sweep failed with exit code {e.returncode}")
+        sys.exit(1)
+
+def index_project(project_name, approximate=False):
+    """Build a project's similarity-search index"""
+    config_file = Path('projects') / project_name / 'config.json'
+    
+    if not config_file.exists():
+        print(f"Error: Project '{project_name}' not found!")
+        return
+    
+    import subprocess
+    cmd = [
+        sys.executable,
+        'scripts/build_index.py',
+        '--project', project_name
+    ]
+    if approximate:
+        cmd.append('--approximate')
+    
+    try:
+        subprocess.run(cmd, check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"\nError: Indexing failed with exit code {e.returncode}")
+        sys.exit(1)
+
+def score_pool(project_name, method=None):
+    """Rank a project's unlabeled pool for labeling"""
+    config_file = Path('projects') / project_name / 'config.json'
+    
+    if not config_file.exists():
+        print(f"Error: Project '{project_name}' not found!")
+        return
+    
+    import subprocess
+    cmd = [
+        sys.executable,
+        'scripts/score_pool.py',
+        '--project', project_name
+    ]
+    if method:
+        cmd += ['--method', method]
+    
+    try:
+        subprocess.run(cmd, check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"\nError: Scoring failed with exit code {e.returncode}")
+        sys.exit(1)
+    
+    queue_file = Path('projects') / project_name / 'active_learning' / 'queue.json'
+    if not queue_file.exists():
+        # Handed over to a scorer that is still running
+        return
+    
+    with open(queue_file, 'r') as f:
+        queue = json.load(f)
+    
+    print(f"\n{'='*70}")
+    print(f"{'IMAGE':<40} {'PREDICTION':<15} {queue['method'].upper()}")
+    print(f"{'='*70}")
+    for item in queue['items'][:20]:
+        print(f"{item['path']:<40} {item['prediction']:<15} {item['uncertainty']:.3f}")
+    print(f"{'='*70}\n")
+
+def export_project(project_name, output=None, shard_size_mb=None):
+    """Pack a project into tar shards plus an index"""
+    project_dir = Path('projects') / project_name
+    
+    if not (project_dir / 'config.json').exists():
+        print(f"Error: Project '{project_name}' not found!")
+        return
+    
+    from config import ARCHIVE_SHARD_SIZE
+    from utils.archive import export_project as write_archive
+    
+    output = output or f"{project_name}.archive"
+    shard_size = shard_size_mb * 1024 * 1024 if shard_size_mb else ARCHIVE_SHARD_SIZE
+    index = write_archive(str(project_dir), output, shard_size)
+    
+    print(f"✓ Exported '{project_name}' to {output}")
+    print(f"  Shards: {len(index['shards'])}")
+    print(f"  Images: {index['num_samples']} in {len(index['classes'])} classes")
+
+def import_project(archive, name=None):
+    """Create a project from an exported archive directory or tar file"""
+    from utils.archive import archive_sources, import_archive, read_index
+    
+    if not os.path.exists(archive):
+        print(f"Error: Archive '{archive}' not found!")
+        return
+    
+    if name is None:
+        if not os.path.isdir(archive):
+            print("Error: --name is required when importing a single tar file")
+            return
+        name = read_index(archive)['project']
+    
+    project_dir = Path('projects') / name
+    try:
+        import_archive(archive_sources(archive), str(project_dir))
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    
+    print(f"✓ Project '{name}' imported to {project_dir}")
+
+def run_benchmark(output='benchmark_results.json', baseline=None, threshold=0.1,
+                  save_baseline=False, extra_args=None):
+    """Run the training and inference benchmark suite"""
+    import subprocess
+    cmd = [
+        sys.executable,
+        'scripts/benchmark.py',
+        '--output', output,
+        '--threshold', str(threshold)
+    ]
+    if baseline:
+        cmd += ['--baseline', baseline]
+    if save_baseline:
+        cmd.append('--save_baseline')
+    cmd += extra_args or []
+    
+    result = subprocess.run(cmd)
+    if result.returncode != 0:
+        sys.exit(result.returncode)
+
 def main():
     parser = argparse.ArgumentParser(
         description='Custom Image Classifier CLI',
@@ -154,6 +311,14 @@ Examples:
   %(prog)s info my_project                   # Show project details
   %(prog)s create animal_classifier          # Create new project
   %(prog)s train my_project --epochs 20      # Train model
+  %(prog)s train my_project --procs 4        # Train with 4 data-parallel processes
+  %(prog)s train my_project --balanced       # Oversample small classes
+  %(prog)s sweep my_project --trials 20      # Tune hyperparameters
+  %(prog)s index my_project                  # Build similarity-search index
+  %(prog)s score my_project                  # Rank unlabeled pool images for labeling
+  %(prog)s export my_project                 # Pack into tar shards
+  %(prog)s import my_project.archive         # Recreate the project on this host
+  %(prog)s bench --baseline baseline.json    # Benchmark and check for regressions
         """
     )
     
@@ -175,6 +340,63 @@ Examples:
     train_parser = subparsers.add_parser('train', help='Train a project model')
     train_parser.add_argument('project', help='Project name')
     train_parser.add_argument('--epochs', '-e', type=int, default=10, help='Number of epochs')
+    train_parser.add_argument('--procs', '-p', type=int, default=1,
+                              help='Number of data-parallel training processes')
+    train_parser.add_argument('--balanced', action='store_true',
+                              help='Sample images inversely to their class size')
+    
+    # Sweep command
+    sweep_parser = subparsers.add_parser('sweep', help='Tune hyperparameters and keep the best model')
+    sweep_parser.add_argument('project', help='Project name')
+    sweep_parser.add_argument('--strategy', '-s', choices=['grid', 'random'], default='random',
+                              help='Search strategy')
+    sweep_parser.add_argument('--trials', '-t', type=int, default=10, help='Number of random trials')
+    sweep_parser.add_argument('--cpu-budget', type=int, default=None,
+                              help='CPU threads the sweep may use (default: all cores)')
+    sweep_parser.add_argument('--max-trials', type=int, default=None,
+                              help='Refuse sweeps with more trials than this (default: 20)')
+    
+    # Index command
+    index_parser = subparsers.add_parser('index', help='Build a similarity-search index')
+    index_parser.add_argument('project', help='Project name')
+    index_parser.add_argument('--approximate', action='store_true',
+                              help='Also build the approximate (IVF) index')
+    
+    # Score command
+    score_parser = subparsers.add_parser('score', help='Rank unlabeled pool images by uncertainty')
+    score_parser.add_argument('project', help='Project name')
+    score_parser.add_argument('--method', '-m', choices=['entropy', 'margin'], default=None,
+                              help='Uncertainty measure (default: UNCERTAINTY_METHOD)')
+    
+    # Export command
+    export_parser = subparsers.add_parser('export', help='Pack a project into a sharded archive')
+    export_parser.add_argument('project', help='Project name')
+    export_parser.add_argument('--output', '-o', default=None,
+                               help='Archive directory (default: <project>.archive)')
+    export_parser.add_argument('--shard-size', type=int, default=None,
+                               help='Shard size in MB (default: ARCHIVE_SHARD_SIZE)')
+    
+    # Import command
+    import_parser = subparsers.add_parser('import', help='Create a project from an archive')
+    import_parser.add_argument('archive', help='Archive directory or tar file')
+    import_parser.add_argument('--name', '-n', default=None,
+                               help='Project name (default: the exported project name)')
+    
+    # Bench command
+    bench_parser = subparsers.add_parser('bench', help='Benchmark training and inference')
+    bench_parser.add_argument('--output', '-o', default='benchmark_results.json', help='Results JSON path')
+    bench_parser.add_argument('--baseline', '-b', default=None, help='Baseline JSON to compare against')
+    bench_parser.add_argument('--threshold', type=float, default=0.1,
+                              help='Allowed relative regression before failing (default: 0.1)')
+    bench_parser.add_argument('--save-baseline', action='store_true',
+                              help='Store the results as the new baseline')
+    bench_parser.add_argument('--classes', type=int, default=None, help='Number of synthetic classes')
+    bench_parser.add_argument('--images-per-class', type=int, default=None,
+                              help='Synthetic images per class')
+    bench_parser.add_argument('--startup-only', action='store_true',
+                              help='Only check CLI and app import time')
+    bench_parser.add_argument('--repeats', type=int, default=None,
+                              help='Runs whose per-metric medians are compared (default: 3)')
     
     args = parser.parse_args()
     
@@ -189,7 +411,28 @@ Examples:
     elif args.command == 'create':
         create_project(args.name, args.description)
     elif args.command == 'train':
-        train_project(args.project, args.epochs)
+        train_project(args.project, args.epochs, args.procs, args.balanced)
+    elif args.command == 'sweep':
+        sweep_project(args.project, args.strategy, args.trials, args.cpu_budget, args.max_trials)
+    elif args.command == 'index':
+        index_project(args.project, args.approximate)
+    elif args.command == 'score':
+        score_pool(args.project, args.method)
+    elif args.command == 'export':
+        export_project(args.project, args.output, args.shard_size)
+    elif args.command == 'import':
+        import_project(args.archive, args.name)
+    elif args.command == 'bench':
+        extra_args = []
+        if args.classes:
+            extra_args += ['--classes', str(args.classes)]
+        if args.images_per_class:
+            extra_args += ['--images_per_class', str(args.images_per_class)]
+        if args.startup_only:
+            extra_args.append('--startup_only')
+        if args.repeats:
+            extra_args += ['--repeats', str(args.repeats)]
+        run_benchmark(args.output, args.baseline, args.threshold, args.save_baseline, extra_args)
 
 if __name__ == '__main__':
     main()
@@ -49,3 +49,31 @@ SAVE_BEST_MODEL = True
 # Logging
 ENABLE_LOGGING = True
 LOG_LEVEL = 'INFO'
+
+# Serving
+MODEL_CACHE_SIZE = 32  # Loaded models kept in memory per worker
+WARM_UP_ON_START = False  # Load trained models at startup; /api/health returns 503 until done
+TTA_VIEWS = ('identity', 'hflip', 'center_crop')  # Views used when a request enables TTA
+TTA_AGGREGATION = 'mean'  # 'mean', 'max' or 'geometric'
+PREDICT_BATCH_MAX = 64  # Images accepted by one /api/predict/batch request
+EXPLANATION_CACHE_SIZE = 256  # Grad-CAM heatmaps kept per worker, by image hash and model
+USE_MMAP_WEIGHTS = True  # Serve from model.safetensors memory maps shared by all workers
+
+# Similarity search
+EMBEDDING_BATCH_SIZE = 64  # Images embedded per forward pass when indexing
+INDEX_APPROXIMATE_MIN_IMAGES = 50000  # Build an approximate (IVF) index from this many images
+INDEX_NPROBE = 8  # IVF lists searched per query
+
+# Active learning
+POOL_BATCH_SIZE = 64  # Unlabeled images scored per forward pass
+UNCERTAINTY_METHOD = 'entropy'  # 'entropy' or 'margin'
+LABELING_QUEUE_SIZE = 200  # Most uncertain pool images kept in the labeling queue
+
+# Project archives
+ARCHIVE_SHARD_SIZE = 256 * 1024 * 1024  # Bytes of files per tar shard
+ARCHIVE_EXCLUDE = ('cache', 'index', 'active_learning', 'sweeps')  # Derived project data left out of archives
+ARCHIVE_SHUFFLE_BUFFER = 1000  # Images buffered to shuffle when training from shards
+
+# Monitoring
+PROFILE_SAMPLE_RATE = 0.0  # Fraction of requests profiled with cProfile (0 disables)
+PROFILE_DIR = 'profiles'
@@ -1,7 +1,27 @@
+import json
+import os
+import struct
+import warnings
+
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+# dtype names used in the safetensors header
+_SAFETENSORS_DTYPES = {
+    torch.float32: ('F32', np.float32),
+    torch.float16: ('F16', np.float16),
+    torch.int64: ('I64', np.int64),
+}
+_NUMPY_DTYPES = {name: np_dtype for name, np_dtype in _SAFETENSORS_DTYPES.values()}
+
+# Memory-mapped weights are read-only on purpose. Filtered once here rather
+# than with catch_warnings(), which is not thread-safe and models are loaded
+# from request threads.
+warnings.filterwarnings('ignore', message='The given NumPy array is not writable',
+                        category=UserWarning)
+
 # Define CNN model architecture for image classification
 class ImageClassifier(nn.Module):
     """
@@ -32,23 +52,82 @@ class ImageClassifier(nn.Module):
         # Dropout for regularization
         self.dropout = nn.Dropout(0.5)
 
-    def forward(self, x):
+    def features(self, x):
+        """
+        Activations of the conv3 block (after batch norm and ReLU, before
+        pooling), of shape (N, 128, 32, 32). Grad-CAM explains these.
+        """
         # Convolutional layers with batch norm and pooling
         x = self.pool(F.relu(self.bn1(self.conv1(x))))
         x = self.pool(F.relu(self.bn2(self.conv2(x))))
-        x = self.pool(F.relu(self.bn3(self.conv3(x))))
+        return F.relu(self.bn3(self.conv3(x)))
+
+    def embed_features(self, features):
+        """fc2 embeddings computed from conv3 block activations"""
+        x = self.pool(features)
 
         # Flatten before passing to FC layers
         x = x.view(x.size(0), -1)
-        
+
         # Fully connected layers with dropout
         x = F.relu(self.fc1(x))
         x = self.dropout(x)
-        x = F.relu(self.fc2(x))
+        return F.relu(self.fc2(x))
+
+    def classify_features(self, features):
+        """Class logits computed from conv3 block activations"""
+        x = self.embed_features(features)
         x = self.dropout(x)
-        x = self.fc3(x)
+        return self.fc3(x)
+
+    def embed(self, x):
+        """
+        Penultimate-layer (fc2) activations, used as image embeddings.
+        """
+        return self.embed_features(self.features(x))
+
+    def forward(self, x):
+        return self.classify_features(self.features(x))
 
-        return x
+def grad_cam(model, images, target_classes=None):
+    """
+    Class logits and Grad-CAM heatmaps on the conv3 block for a batch.
+
+    The convolutional layers run once without autograd; only the layers
+    after conv3 are recorded, and a single backward pass computes the
+    gradient of every image's target logit with respect to its conv3
+    activations (no parameter gradients are computed). Images do not
+    interact in evaluation mode, so one backward serves the whole batch.
+
+    Args:
+        model: ImageClassifier in evaluation mode
+        images: Normalized input batch of shape (N, 3, H, W)
+        target_classes: Class index to explain per image (default: the
+            predicted class)
+
+    Returns:
+        tuple: (logits of shape (N, classes), heatmaps of shape (N, H, W)
+                scaled to [0, 1] per image)
+    """
+    with torch.no_grad():
+        features = model.features(images)
+
+    features.requires_grad_(True)
+    with torch.enable_grad():
+        logits = model.classify_features(features)
+        if target_classes is None:
+            target_classes = logits.argmax(dim=1)
+        target_classes = torch.as_tensor(target_classes, device=logits.device).view(-1, 1)
+        score = logits.gather(1, target_classes).sum()
+        gradients, = torch.autograd.grad(score, features)
+
+    with torch.no_grad():
+        # Channel weights are the spatially averaged gradients
+        weights = gradients.mean(dim=(2, 3), keepdim=True)
+        cams = F.relu((weights * features).sum(dim=1, keepdim=True))
+        cams = F.interpolate(cams, size=images.shape[-2:], mode='bilinear', align_corners=False)[:, 0]
+        peak = cams.flatten(1).max(dim=1).values.clamp_min(1e-12).view(-1, 1, 1)
+        return logits.detach(), cams / peak
 
 def load_model(model_path, num_classes):
     """
@@ -62,7 +141,8 @@ def load_model(model_path, num_classes):
         Loaded model in evaluation mode
     """
     model = ImageClassifier(num_classes=num_classes)
-    model.load_state_dict(torch.load(model_path, map_location=torch.device('cpu')))
+    model.load_state_dict(torch.load(model_path, map_location=torch.device('cpu'),
+                                     weights_only=True))
     model.eval()
     return model
 
@@ -77,3 +157,84 @@ def create_model(num_classes):
         New model instance
     """
     return ImageClassifier(num_classes=num_classes)
+
+def save_mmap_weights(state_dict, path):
+    """
+    Save a state dict in the safetensors layout so it can be memory-mapped.
+
+    The file is an 8-byte header length, a JSON header with each tensor's
+    dtype, shape and byte offsets, then the raw tensor data. Tensors are
+    ordered by element size so every one stays naturally aligned.
+
+    Args:
+        state_dict: Model state dict
+        path: Output file path
+    """
+    tensors = sorted(((name, t.detach().cpu().contiguous()) for name, t in state_dict.items()),
+                     key=lambda item: -item[1].element_size())
+    header = {}
+    offset = 0
+    for name, tensor in tensors:
+        nbytes = tensor.numel() * tensor.element_size()
+        header[name] = {
+            'dtype': _SAFETENSORS_DTYPES[tensor.dtype][0],
+            'shape': list(tensor.shape),
+            'data_offsets': [offset, offset + nbytes]
+        }
+        offset += nbytes
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+    # Pad so the data section starts on a 64-byte boundary
+    header_bytes += b' ' * (-(8 + len(header_bytes)) % 64)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for _, tensor in tensors:
+            f.write(tensor.numpy().tobytes())
+    os.replace(tmp_path, path)
+
+def load_mmap_weights(path):
+    """
+    Map a file written by save_mmap_weights read-only into a state dict.
+
+    The tensors point straight into the mapping, so nothing is copied and
+    every process mapping the same file shares the same physical pages.
+    """
+    with open(path, 'rb') as f:
+        header_len = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_len))
+
+    data = np.memmap(path, dtype=np.uint8, mode='r', offset=8 + header_len)
+    state_dict = {}
+    for name, info in header.items():
+        if name == '__metadata__':
+            continue
+        begin, end = info['data_offsets']
+        array = data[begin:end].view(_NUMPY_DTYPES[info['dtype']]).reshape(info['shape'])
+        state_dict[name] = torch.from_numpy(array)
+    return state_dict
+
+def load_model_mmap(weights_path, num_classes):
+    """
+    Load a model whose weights alias a read-only memory mapping.
+
+    The model must only be used for inference: its parameters live in
+    read-only pages.
+
+    Args:
+        weights_path: File written by save_mmap_weights
+        num_classes: Number of output classes
+
+    Returns:
+        Model in evaluation mode
+    """
+    # Build on the meta device so no memory is allocated for the random
+    # initial weights that are about to be replaced
+    with torch.device('meta'):
+        model = ImageClassifier(num_classes=num_classes)
+    model.load_state_dict(load_mmap_weights(weights_path), assign=True)
+    model.requires_grad_(False)
+    model.eval()
+    return model
@@ -0,0 +1,454 @@
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+# Whether a larger value of a metric is better; used when comparing to a baseline
+HIGHER_IS_BETTER = {
+    'train.images_per_sec': True,
+    'train.epoch_time_s': False,
+    'predict.cold_ms': False,
+    'predict.warm_mean_ms': False,
+    'predict.warm_p50_ms': False,
+    'predict.warm_p90_ms': False,
+    'predict.warm_p99_ms': False,
+    'api.requests_per_sec': True,
+    'api.p50_ms': False,
+    'api.p99_ms': False,
+    'memory.peak_rss_mb': False,
+    'tta.single_view_accuracy': True,
+    'tta.accuracy': True,
+    'tta.single_view_ms': False,
+    'tta.ms': False,
+    'explain.ms': False,
+    'explain.cached_ms': False,
+    'explain.overhead_ratio': False,
+    'startup.cli_list_ms': False,
+    'startup.app_import_ms': False,
+}
+
+# Single-shot and tail-latency metrics vary more between runs than means and
+# throughputs; they may regress by this much even when --threshold is lower
+METRIC_TOLERANCES = {
+    'predict.cold_ms': 0.5,
+    'predict.warm_p99_ms': 0.3,
+    'api.p99_ms': 0.3,
+    'explain.cached_ms': 0.3,
+    'startup.cli_list_ms': 0.5,
+    'startup.app_import_ms': 0.3,
+}
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Modules that must not be imported on the light CLI and app startup paths
+HEAVY_MODULES = ('torch', 'torchvision', 'cv2', 'PIL')
+
+# Default import-time budget of `cli.py list`, in milliseconds
+CLI_BUDGET_MS = 500
+
+# Runs a snippet in a fresh interpreter and reports its wall time and which
+# heavy modules it pulled in
+_STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{code}
+elapsed = (time.perf_counter() - start) * 1000
+heavy = sorted(m for m in {heavy!r} if m in sys.modules)
+sys.__stdout__.write("\\n" + json.dumps({{"ms": elapsed, "heavy": heavy}}) + "\\n")
+"""
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _probe_startup(code, repeats):
+    """Median wall time of a snippet in fresh interpreters, plus heavy modules it imported"""
+    timings = []
+    heavy = []
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT))
+    probe = _STARTUP_PROBE.format(code=code, heavy=HEAVY_MODULES)
+    # Run from an empty directory so the probes neither see nor create real projects
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(repeats):
+            output = subprocess.run([sys.executable, '-c', probe], cwd=workdir, env=env,
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            timings.append(result['ms'])
+            heavy = result['heavy']
+    return statistics.median(timings), heavy
+
+def bench_startup(repeats=5):
+    """
+    Import time of `cli.py list` and of app.py, each in a fresh interpreter.
+
+    Returns:
+        tuple: (metrics dict, {probe name: heavy modules imported})
+    """
+    cli_ms, cli_heavy = _probe_startup(
+        f"import runpy; sys.argv = ['cli.py', 'list']; "
+        f"runpy.run_path({str(REPO_ROOT / 'cli.py')!r}, run_name='__main__')",
+        repeats)
+    app_ms, app_heavy = _probe_startup("import app", repeats)
+    metrics = {
+        'startup.cli_list_ms': cli_ms,
+        'startup.app_import_ms': app_ms,
+    }
+    return metrics, {'cli_list': cli_heavy, 'app_import': app_heavy}
+
+def check_startup(metrics, heavy_imports, cli_budget_ms):
+    """Return a list of startup budget violations"""
+    problems = []
+    if metrics['startup.cli_list_ms'] > cli_budget_ms:
+        problems.append(f"`cli.py list` took {metrics['startup.cli_list_ms']:.0f} ms "
+                        f"(budget {cli_budget_ms:.0f} ms)")
+    for probe, modules in heavy_imports.items():
+        if modules:
+            problems.append(f"{probe} imported heavy modules: {', '.join(modules)}")
+    return problems
+
+def bench_training(project_name, epochs, batch_size):
+    """Training throughput and epoch time on the synthetic project"""
+    from scripts.train_model import train_model
+
+    if not train_model(project_name, epochs=epochs, batch_size=batch_size):
+        raise RuntimeError("Training benchmark failed")
+
+    with open(os.path.join('projects', project_name, 'config.json'), 'r') as f:
+        history = json.load(f)['training_history']
+    # Treat the first epoch as warm-up when there is more than one
+    measured = history[1:] or history
+    return {
+        'train.images_per_sec': statistics.mean(h['images_per_sec'] for h in measured),
+        'train.epoch_time_s': statistics.mean(h['epoch_time'] for h in measured),
+    }
+
+def bench_predict(project_name, image_path, iterations):
+    """predict_image latency: the first (cold) call and the warm distribution"""
+    import cv2
+    from utils.predictor import predict_image
+
+    with open(os.path.join('projects', project_name, 'config.json'), 'r') as f:
+        class_labels = json.load(f)['classes']
+    model_path = os.path.join('projects', project_name, 'models', 'model.pth')
+    image = cv2.imread(image_path)
+
+    start = time.perf_counter()
+    predict_image(image, model_path, class_labels)
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        predict_image(image, model_path, class_labels)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'predict.cold_ms': cold_ms,
+        'predict.warm_mean_ms': statistics.mean(latencies),
+        'predict.warm_p50_ms': percentile(latencies, 50),
+        'predict.warm_p90_ms': percentile(latencies, 90),
+        'predict.warm_p99_ms': percentile(latencies, 99),
+    }
+
+def bench_tta(project_name, views=None, aggregation=None, max_images=200):
+    """Accuracy and mean latency of test-time augmentation against the single-view path"""
+    import cv2
+    from utils.dataset_cache import scan_dataset
+    from utils.predictor import predict_image
+
+    project_dir = os.path.join('projects', project_name)
+    with open(os.path.join(project_dir, 'config.json'), 'r') as f:
+        class_labels = json.load(f)['classes']
+    model_path = os.path.join(project_dir, 'models', 'model.pth')
+    _, samples = scan_dataset(os.path.join(project_dir, 'dataset'))
+    # Spread the sample over all classes
+    samples = samples[::max(1, len(samples) // max_images)][:max_images]
+
+    results = {}
+    for name, tta in (('single_view', None), ('tta', views or True)):
+        correct = 0
+        latencies = []
+        for path, class_index in samples:
+            image = cv2.imread(path)
+            start = time.perf_counter()
+            prediction, _ = predict_image(image, model_path, class_labels, tta=tta,
+                                          aggregation=aggregation)
+            latencies.append((time.perf_counter() - start) * 1000)
+            correct += prediction == class_labels[class_index]
+        results[name] = (100 * correct / len(samples), statistics.mean(latencies))
+
+    return {
+        'tta.single_view_accuracy': results['single_view'][0],
+        'tta.accuracy': results['tta'][0],
+        'tta.single_view_ms': results['single_view'][1],
+        'tta.ms': results['tta'][1],
+    }
+
+def bench_explain(project_name, image_path, iterations):
+    """
+    Mean latency of Grad-CAM explanations against plain prediction.
+
+    explain.ms bypasses the explanation cache (no image key); overhead_ratio
+    is explain.ms over the plain predict_image latency.
+    """
+    import cv2
+    from utils.predictor import predict_image, explain_image
+
+    project_dir = os.path.join('projects', project_name)
+    with open(os.path.join(project_dir, 'config.json'), 'r') as f:
+        class_labels = json.load(f)['classes']
+    model_path = os.path.join(project_dir, 'models', 'model.pth')
+    image = cv2.imread(image_path)
+
+    def mean_ms(fn):
+        fn()
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            fn()
+            latencies.append((time.perf_counter() - start) * 1000)
+        return statistics.mean(latencies)
+
+    plain_ms = mean_ms(lambda: predict_image(image, model_path, class_labels))
+    explain_ms = mean_ms(lambda: explain_image(image, model_path, class_labels))
+    cached_ms = mean_ms(lambda: explain_image(image, model_path, class_labels, image_key='benchmark'))
+
+    return {
+        'explain.ms': explain_ms,
+        'explain.cached_ms': cached_ms,
+        'explain.overhead_ratio': explain_ms / plain_ms,
+    }
+
+def bench_api(project_name, image_path, num_requests, concurrency):
+    """/api/predict throughput under concurrent load through the Flask test client"""
+    from app import app
+
+    with open(image_path, 'rb') as f:
+        image_bytes = f.read()
+
+    def send(_):
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.post('/api/predict', data={
+            'project_name': project_name,
+            'image': (io.BytesIO(image_bytes), 'image.png')
+        }, content_type='multipart/form-data')
+        return (time.perf_counter() - start) * 1000, response.status_code
+
+    # One request up front so imports and lazy initialisation are not measured
+    send(None)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, range(num_requests)))
+    elapsed = time.perf_counter() - start
+
+    errors = sum(1 for _, status in results if status != 200)
+    if errors:
+        raise RuntimeError(f"{errors} of {num_requests} /api/predict requests failed")
+
+    latencies = [latency for latency, _ in results]
+    return {
+        'api.requests_per_sec': num_requests / elapsed,
+        'api.p50_ms': percentile(latencies, 50),
+        'api.p99_ms': percentile(latencies, 99),
+    }
+
+def run_benchmarks(num_classes=4, images_per_class=100, epochs=2, batch_size=32,
+                   predict_iterations=50, api_requests=200, concurrency=8):
+    """
+    Run the benchmark suite on a synthetic project in a temporary directory.
+
+    Returns:
+        dict with 'meta' (run parameters and environment), 'metrics' and
+        'heavy_imports' (heavy modules loaded on the startup paths)
+    """
+    from utils.synthetic import make_synthetic_project
+
+    # Startup first, before this process imports anything heavy itself
+    print("Benchmarking startup...")
+    metrics, heavy_imports = bench_startup()
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            project_dir = make_synthetic_project('benchmark', num_classes, images_per_class)
+            image_path = os.path.join(project_dir, 'dataset', 'class_00', '00000.png')
+
+            print("Benchmarking training...")
+            metrics.update(bench_training('benchmark', epochs, batch_size))
+            print("Benchmarking predict_image...")
+            metrics.update(bench_predict('benchmark', image_path, predict_iterations))
+            print("Benchmarking test-time augmentation...")
+            metrics.update(bench_tta('benchmark'))
+            print("Benchmarking Grad-CAM explanations...")
+            metrics.update(bench_explain('benchmark', image_path, predict_iterations))
+            print("Benchmarking /api/predict...")
+            metrics.update(bench_api('benchmark', image_path, api_requests, concurrency))
+        finally:
+            os.chdir(cwd)
+
+    metrics['memory.peak_rss_mb'] = peak_rss_mb()
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'params': {
+                'num_classes': num_classes,
+                'images_per_class': images_per_class,
+                'epochs': epochs,
+                'batch_size': batch_size,
+                'predict_iterations': predict_iterations,
+                'api_requests': api_requests,
+                'concurrency': concurrency
+            }
+        },
+        'metrics': metrics,
+        'heavy_imports': heavy_imports
+    }
+
+def median_metrics(runs):
+    """Per-metric median over the metrics dicts of repeated runs"""
+    names = {name for metrics in runs for name in metrics}
+    return {name: statistics.median(metrics[name] for metrics in runs if name in metrics)
+            for name in sorted(names)}
+
+def compare_to_baseline(metrics, baseline, threshold, tolerances=METRIC_TOLERANCES):
+    """
+    Compare metrics against a baseline.
+
+    Args:
+        metrics: Current metric values
+        baseline: Baseline metric values
+        threshold: Allowed relative regression, e.g. 0.1 for 10%
+        tolerances: Wider allowed regressions of individual noisy metrics
+
+    Returns:
+        List of dicts describing every compared metric, with a 'regressed' flag
+    """
+    comparison = []
+    for name, value in metrics.items():
+        base = baseline.get(name)
+        if base is None or base == 0 or name not in HIGHER_IS_BETTER:
+            continue
+        change = (value - base) / base
+        regression = -change if HIGHER_IS_BETTER[name] else change
+        tolerance = max(threshold, tolerances.get(name, 0))
+        comparison.append({
+            'metric': name,
+            'baseline': base,
+            'current': value,
+            'change': change,
+            'tolerance': tolerance,
+            'regressed': regression > tolerance
+        })
+    return comparison
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark training and inference')
+    parser.add_argument('--classes', type=int, default=4, help='Number of synthetic classes')
+    parser.add_argument('--images_per_class', type=int, default=100, help='Synthetic images per class')
+    parser.add_argument('--epochs', type=int, default=2, help='Training epochs')
+    parser.add_argument('--batch_size', type=int, default=32, help='Training batch size')
+    parser.add_argument('--predict_iterations', type=int, default=50, help='Warm predict_image calls')
+    parser.add_argument('--api_requests', type=int, default=200, help='Number of /api/predict requests')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent /api/predict clients')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', help='Results JSON path')
+    parser.add_argument('--baseline', type=str, default=None, help='Baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Allowed relative regression before failing (default: 0.1 = 10%%); '
+                             'noisy metrics allow at least METRIC_TOLERANCES')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='Run the suite this many times and compare per-metric medians')
+    parser.add_argument('--save_baseline', action='store_true',
+                        help='Also write the results to --baseline')
+    parser.add_argument('--cli_budget_ms', type=float, default=CLI_BUDGET_MS,
+                        help='Fail when `cli.py list` takes longer than this (default: 500)')
+    parser.add_argument('--startup_only', action='store_true',
+                        help='Only run the startup import-time checks')
+
+    args = parser.parse_args()
+
+    if args.baseline and not args.save_baseline and not os.path.exists(args.baseline):
+        print(f"Error: Baseline {args.baseline} not found; record one with --save_baseline first")
+        sys.exit(1)
+
+    if args.startup_only:
+        # bench_startup already takes the median of several fresh interpreters
+        metrics, heavy_imports = bench_startup()
+        results = {'metrics': metrics, 'heavy_imports': heavy_imports}
+    else:
+        runs = []
+        for repeat in range(max(1, args.repeats)):
+            if args.repeats > 1:
+                print(f"\nRun {repeat + 1}/{args.repeats}")
+            runs.append(run_benchmarks(args.classes, args.images_per_class, args.epochs,
+                                       args.batch_size, args.predict_iterations, args.api_requests,
+                                       args.concurrency))
+        results = runs[0]
+        results['meta']['repeats'] = len(runs)
+        results['metrics'] = median_metrics([run['metrics'] for run in runs])
+        results['runs'] = [run['metrics'] for run in runs]
+        results['heavy_imports'] = {probe: sorted({m for run in runs for m in run['heavy_imports'][probe]})
+                                    for probe in results['heavy_imports']}
+
+    startup_problems = check_startup(results['metrics'], results['heavy_imports'], args.cli_budget_ms)
+    failed = bool(startup_problems)
+    if args.baseline and not args.save_baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['metrics']
+        results['comparison'] = compare_to_baseline(results['metrics'], baseline, args.threshold)
+        failed = failed or any(c['regressed'] for c in results['comparison'])
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    print(f"\n{'='*70}")
+    print(f"{'METRIC':<28} {'VALUE':>12} {'BASELINE':>12} {'CHANGE':>10}")
+    print(f"{'='*70}")
+    compared = {c['metric']: c for c in results.get('comparison', [])}
+    for name, value in results['metrics'].items():
+        c = compared.get(name)
+        if c:
+            flag = '  ✗' if c['regressed'] else ''
+            print(f"{name:<28} {value:>12.2f} {c['baseline']:>12.2f} {c['change']*100:>+9.1f}%{flag}")
+        else:
+            print(f"{name:<28} {value:>12.2f}")
+    print(f"{'='*70}")
+    print(f"Results written to: {args.output}\n")
+
+    for problem in startup_problems:
+        print(f"Error: {problem}")
+    for c in results.get('comparison', []):
+        if c['regressed']:
+            print(f"Error: {c['metric']} regressed by more than {c['tolerance']*100:.0f}% "
+                  f"against {args.baseline}")
+    sys.exit(1 if failed else 0)
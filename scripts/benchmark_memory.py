@@ -0,0 +1,135 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+def memory_usage_mb():
+    """
+    Resident memory of this process in MB.
+
+    rss counts every resident page, pss splits shared pages between the
+    processes mapping them and uss counts only pages private to this process.
+    pss and uss need Linux; elsewhere they are reported as None.
+    """
+    usage = {'rss': None, 'pss': None, 'uss': None}
+    try:
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            fields = {line.split(':')[0]: int(line.split()[1]) for line in f if line.endswith('kB\n')}
+    except OSError:
+        import resource
+        scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        usage['rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+        return usage
+
+    usage['rss'] = fields.get('Rss', 0) / 1024
+    usage['pss'] = fields.get('Pss', 0) / 1024
+    usage['uss'] = (fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)) / 1024
+    return usage
+
+def _load_worker(model_paths, num_classes, use_mmap, loaded, done, results):
+    """Load every model through the serving cache and report memory growth"""
+    import torch
+    import utils.predictor as predictor
+
+    torch.set_num_threads(1)
+    predictor.USE_MMAP_WEIGHTS = use_mmap
+    device = torch.device('cpu')
+    sample = torch.zeros(1, 3, 128, 128)
+
+    before = memory_usage_mb()
+    models = []
+    for model_path in model_paths:
+        model = predictor.get_model(model_path, num_classes, device)
+        # A forward pass touches every weight page, as serving would
+        with torch.no_grad():
+            model(sample)
+        models.append(model)
+
+    # Measure while every worker holds its models so shared pages are split
+    loaded.wait()
+    after = memory_usage_mb()
+    results.put({name: None if after[name] is None else after[name] - before[name]
+                 for name in after})
+    done.wait()
+
+def run_memory_benchmark(num_projects=8, workers=4, num_classes=10):
+    """
+    Measure per-worker memory for serving num_projects models from workers
+    processes, loading weights with torch.load and with memory maps.
+
+    Models are random-initialised and written to a temporary directory in
+    both formats, so real projects are never touched.
+
+    Returns:
+        Dict mapping 'torch' and 'mmap' to the mean per-worker growth in
+        rss/pss/uss MB
+    """
+    import torch
+    from models.model import ImageClassifier
+    from utils.model_store import write_mmap_weights
+
+    summary = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        model_paths = []
+        for i in range(num_projects):
+            model_dir = os.path.join(workdir, f"project_{i}", 'models')
+            os.makedirs(model_dir)
+            model_path = os.path.join(model_dir, 'model.pth')
+            torch.save(ImageClassifier(num_classes=num_classes).state_dict(), model_path)
+            write_mmap_weights(model_path)
+            model_paths.append(model_path)
+
+        ctx = multiprocessing.get_context('spawn')
+        for mode in ('torch', 'mmap'):
+            loaded, done = ctx.Barrier(workers + 1), ctx.Barrier(workers + 1)
+            results = ctx.Queue()
+            procs = [ctx.Process(target=_load_worker,
+                                 args=(model_paths, num_classes, mode == 'mmap', loaded, done, results))
+                     for _ in range(workers)]
+            for p in procs:
+                p.start()
+            loaded.wait()
+            reports = [results.get() for _ in procs]
+            done.wait()
+            for p in procs:
+                p.join()
+
+            summary[mode] = {
+                name: None if reports[0][name] is None else sum(r[name] for r in reports) / len(reports)
+                for name in reports[0]
+            }
+
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Compare per-worker memory of torch.load and memory-mapped model weights')
+    parser.add_argument('--projects', type=int, default=8, help='Number of models each worker serves')
+    parser.add_argument('--workers', type=int, default=4, help='Number of worker processes')
+    parser.add_argument('--classes', type=int, default=10, help='Classes per model')
+    parser.add_argument('--output', type=str, default=None, help='Write the results as JSON')
+
+    args = parser.parse_args()
+
+    summary = run_memory_benchmark(args.projects, args.workers, args.classes)
+
+    def fmt(value):
+        return 'n/a' if value is None else f"{value:.1f}"
+
+    print(f"\n{args.workers} workers x {args.projects} models, growth per worker (MB)")
+    print(f"{'='*45}")
+    print(f"{'LOADER':<10} {'RSS':<12} {'PSS':<12} {'USS'}")
+    print(f"{'='*45}")
+    for mode, usage in summary.items():
+        print(f"{mode:<10} {fmt(usage['rss']):<12} {fmt(usage['pss']):<12} {fmt(usage['uss'])}")
+    print(f"{'='*45}\n")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'projects': args.projects, 'workers': args.workers, 'results': summary}, f, indent=2)
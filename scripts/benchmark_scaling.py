@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from scripts.train_model import train_model
+from utils.synthetic import make_synthetic_project
+
+def run_scaling_benchmark(max_procs, epochs=2, batch_size=32, num_classes=4, images_per_class=200):
+    """
+    Measure data-parallel training throughput for 1 to max_procs processes.
+
+    Trains on a synthetic project inside a temporary directory so real
+    projects are never touched. The first epoch is treated as warm-up and
+    excluded from the reported throughput when more than one epoch runs.
+
+    Returns:
+        List of dicts with procs, images_per_sec and speedup
+    """
+    results = []
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            make_synthetic_project('scaling_benchmark', num_classes, images_per_class)
+            config_path = os.path.join('projects', 'scaling_benchmark', 'config.json')
+
+            for procs in range(1, max_procs + 1):
+                if not train_model('scaling_benchmark', epochs=epochs, batch_size=batch_size,
+                                   procs=procs):
+                    raise RuntimeError(f"Training with {procs} process(es) failed")
+
+                with open(config_path, 'r') as f:
+                    history = json.load(f)['training_history']
+                measured = history[1:] or history
+                images_per_sec = sum(h['images_per_sec'] for h in measured) / len(measured)
+
+                results.append({
+                    'procs': procs,
+                    'images_per_sec': images_per_sec,
+                    'speedup': images_per_sec / results[0]['images_per_sec'] if results else 1.0
+                })
+        finally:
+            os.chdir(cwd)
+
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark data-parallel training scaling')
+    parser.add_argument('--procs', type=int, default=os.cpu_count() or 1,
+                        help='Largest number of processes to try')
+    parser.add_argument('--epochs', type=int, default=2, help='Epochs per run')
+    parser.add_argument('--batch_size', type=int, default=32, help='Global batch size')
+    parser.add_argument('--classes', type=int, default=4, help='Number of synthetic classes')
+    parser.add_argument('--images_per_class', type=int, default=200, help='Synthetic images per class')
+
+    args = parser.parse_args()
+
+    results = run_scaling_benchmark(args.procs, args.epochs, args.batch_size,
+                                    args.classes, args.images_per_class)
+
+    print(f"\n{'='*45}")
+    print(f"{'PROCS':<10} {'IMAGES/SEC':<15} {'SPEEDUP'}")
+    print(f"{'='*45}")
+    for r in results:
+        print(f"{r['procs']:<10} {r['images_per_sec']:<15.1f} {r['speedup']:.2f}x")
+    print(f"{'='*45}\n")
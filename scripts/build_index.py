@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+def build_project_index(project_name, approximate=None, incremental=False):
+    """
+    Build (or incrementally update) a project's similarity-search index.
+
+    Returns:
+        True if the index was written
+    """
+    from utils.embeddings import build_index, update_index
+    from utils.model_store import served_model_path
+    from utils.predictor import get_model
+
+    project_dir = os.path.join('projects', project_name)
+    config_path = os.path.join(project_dir, 'config.json')
+    if not os.path.exists(config_path):
+        print(f"Error: Project '{project_name}' not found!")
+        return False
+
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    if not config.get('trained'):
+        print(f"Error: Project '{project_name}' has no trained model yet")
+        return False
+
+    model_path = served_model_path(project_dir, config)
+    model = get_model(model_path, len(config['classes']))
+
+    start = time.perf_counter()
+    if incremental:
+        count = update_index(project_dir, model, model_path)
+        print(f"✅ Added {count} images to the index in {time.perf_counter() - start:.1f}s")
+    else:
+        count = build_index(project_dir, model, model_path, approximate)
+        print(f"✅ Indexed {count} images in {time.perf_counter() - start:.1f}s")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a project's similarity-search index")
+    parser.add_argument('--project', type=str, required=True, help='Project name')
+    parser.add_argument('--approximate', action='store_true', default=None,
+                        help='Also build the approximate (IVF) index regardless of dataset size')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only embed images that are not indexed yet')
+
+    args = parser.parse_args()
+
+    success = build_project_index(args.project, args.approximate, args.incremental)
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+def export_project_weights(project_name):
+    """
+    Write model.safetensors next to every model.pth of a project (the served
+    model and each stored version) that does not have one yet.
+
+    Returns:
+        Number of files written, or None if the project does not exist
+    """
+    from utils.model_store import write_mmap_weights
+
+    project_dir = os.path.join('projects', project_name)
+    if not os.path.exists(os.path.join(project_dir, 'config.json')):
+        print(f"Error: Project '{project_name}' not found!")
+        return None
+
+    written = 0
+    for root, _, files in os.walk(os.path.join(project_dir, 'models')):
+        if 'model.pth' not in files or os.path.basename(root).startswith('.'):
+            continue
+        weights_path = os.path.join(root, 'model.pth')
+        mmap_path = os.path.join(root, 'model.safetensors')
+        if os.path.exists(mmap_path) and os.path.getmtime(mmap_path) >= os.path.getmtime(weights_path):
+            continue
+        write_mmap_weights(weights_path)
+        print(f"✅ {mmap_path}")
+        written += 1
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Convert trained models to memory-mappable model.safetensors files')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--project', type=str, help='Project name')
+    group.add_argument('--all', action='store_true', help='Convert every project')
+
+    args = parser.parse_args()
+
+    if args.all:
+        projects = []
+        if os.path.exists('projects'):
+            projects = sorted(name for name in os.listdir('projects') if not name.startswith('.')
+                              and os.path.exists(os.path.join('projects', name, 'config.json')))
+    else:
+        projects = [args.project]
+
+    results = [export_project_weights(name) for name in projects]
+    if None in results:
+        sys.exit(1)
+    print(f"Converted {sum(results)} model files")
@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from config import UNCERTAINTY_METHOD, POOL_BATCH_SIZE
+
+def score_project_pool(project_name, method=UNCERTAINTY_METHOD, batch_size=POOL_BATCH_SIZE):
+    """
+    Score a project's unlabeled pool and rebuild its labeling queue.
+
+    If another scorer is running on the project, it is asked to score the
+    pool again when it finishes instead.
+
+    Returns:
+        True if the queue was written or the pass was handed to the running scorer
+    """
+    from utils.active_learning import (pool_dir, score_pool, scoring_lock, request_rescore,
+                                       rescore_requested, take_rescore)
+    from utils.model_store import served_model_path
+
+    project_dir = os.path.join('projects', project_name)
+    config_path = os.path.join(project_dir, 'config.json')
+    if not os.path.exists(config_path):
+        print(f"Error: Project '{project_name}' not found!")
+        return False
+
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    if not config.get('trained'):
+        print(f"Error: Project '{project_name}' has no trained model yet")
+        return False
+    if not os.path.isdir(pool_dir(project_dir)):
+        print(f"Error: Project '{project_name}' has no unlabeled pool at {pool_dir(project_dir)}")
+        return False
+
+    def progress(scored, total):
+        print(f"Scored {scored}/{total} images", flush=True)
+
+    # The pass this process was started for. Whoever holds the lock keeps
+    # scoring while passes are requested, and checks again after releasing
+    # it, so a request made at any point is never lost.
+    lock = scoring_lock(project_dir)
+    request_rescore(project_dir, method)
+    if not lock.acquire(blocking=False):
+        print("Scoring is already running; it will score the pool again when done")
+        return True
+
+    model_path = served_model_path(project_dir, config)
+    while True:
+        try:
+            requested = take_rescore(project_dir)
+            while requested is not None:
+                start = time.perf_counter()
+                scored, queue = score_pool(project_dir, model_path, config['classes'],
+                                           requested or method, batch_size, progress)
+                print(f"✅ Scored {scored} new images in {time.perf_counter() - start:.1f}s; "
+                      f"{len(queue['items'])} of {queue['pool_size']} pool images queued for labeling",
+                      flush=True)
+                requested = take_rescore(project_dir)
+        finally:
+            lock.release()
+        if not rescore_requested(project_dir) or not lock.acquire(blocking=False):
+            return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank a project's unlabeled pool by model uncertainty")
+    parser.add_argument('--project', type=str, required=True, help='Project name')
+    parser.add_argument('--method', choices=['entropy', 'margin'], default=UNCERTAINTY_METHOD,
+                        help='Uncertainty measure used to rank the queue')
+    parser.add_argument('--batch_size', type=int, default=POOL_BATCH_SIZE, help='Images per forward pass')
+
+    args = parser.parse_args()
+
+    success = score_project_pool(args.project, args.method, args.batch_size)
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,362 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+import multiprocessing
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from config import IMAGE_SIZE
+
+# Values tried for each hyperparameter. A list is sampled uniformly (random
+# search) or enumerated (grid search); a dict with min/max is a continuous
+# range for random search, optionally log-scaled, with the values of its
+# 'grid' key used for grid search.
+DEFAULT_SEARCH_SPACE = {
+    'epochs': [5, 10, 20],
+    'batch_size': [16, 32, 64],
+    'learning_rate': {'min': 1e-4, 'max': 1e-2, 'log': True},
+    'horizontal_flip': [True, False],
+    'rotation': [0, 10, 20],
+    'color_jitter': [0.0, 0.2, 0.4],
+}
+
+# Grid search enumerates every combination, so its default space is kept
+# small (8 trials); --space entries replace these
+DEFAULT_GRID = {
+    'epochs': [10],
+    'batch_size': [32],
+    'learning_rate': [1e-3, 1e-2],
+    'horizontal_flip': [True],
+    'rotation': [0, 10],
+    'color_jitter': [0.0, 0.2],
+}
+
+# Sweeps with more trials than this are refused unless --max_trials is raised
+MAX_TRIALS = 20
+
+def grid_trials(space):
+    """Enumerate every combination of the search space"""
+    names = list(space)
+    values = [v['grid'] if isinstance(v, dict) else v for v in space.values()]
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+def random_trials(space, n_trials, seed=0):
+    """Sample n_trials parameter sets from the search space"""
+    rng = random.Random(seed)
+    trials = []
+    for _ in range(n_trials):
+        params = {}
+        for name, values in space.items():
+            if isinstance(values, dict):
+                if values.get('log'):
+                    params[name] = math.exp(rng.uniform(math.log(values['min']), math.log(values['max'])))
+                else:
+                    params[name] = rng.uniform(values['min'], values['max'])
+            else:
+                params[name] = rng.choice(values)
+        trials.append(params)
+    return trials
+
+def plan_trials(strategy='random', n_trials=10, space=None, seed=0, max_trials=MAX_TRIALS):
+    """
+    Parameter sets of a sweep.
+
+    Raises:
+        ValueError: For an unknown strategy or more than max_trials trials
+    """
+    if strategy == 'grid':
+        trials = grid_trials({**DEFAULT_GRID, **(space or {})})
+    elif strategy == 'random':
+        trials = random_trials({**DEFAULT_SEARCH_SPACE, **(space or {})}, n_trials, seed)
+    else:
+        raise ValueError(f"Unknown search strategy '{strategy}'")
+    if len(trials) > max_trials:
+        raise ValueError(f"The sweep has {len(trials)} trials, more than the limit of {max_trials}; "
+                         f"narrow the search space or raise max_trials")
+    return trials
+
+def trial_augmentation(params):
+    """Translate flat trial parameters into a build_augmentation settings dict"""
+    jitter = params.get('color_jitter', 0.0)
+    return {
+        'horizontal_flip': params.get('horizontal_flip', True),
+        'rotation': params.get('rotation', 0),
+        'color_jitter': {'brightness': jitter, 'contrast': jitter, 'saturation': jitter}
+    }
+
+class MedianPruner:
+    """
+    Stop a trial whose validation accuracy at an epoch is below the median
+    that other trials reached at the same epoch.
+
+    Reports live in a multiprocessing.Manager dict so every trial process
+    sees the results of the others.
+    """
+    def __init__(self, reports, lock, warmup_epochs=1, min_trials=3):
+        self.reports = reports
+        self.lock = lock
+        self.warmup_epochs = warmup_epochs
+        self.min_trials = min_trials
+
+    def should_prune(self, epoch, val_accuracy):
+        with self.lock:
+            previous = list(self.reports.get(epoch, []))
+            self.reports[epoch] = previous + [val_accuracy]
+        if epoch <= self.warmup_epochs or len(previous) < self.min_trials:
+            return False
+        return val_accuracy < statistics.median(previous)
+
+def _run_trial(trial_id, params, cache_dir, train_idx, val_idx, trial_dir, threads, pruner, seed):
+    """Train one trial on the shared dataset cache; runs in a worker process"""
+    import torch
+    import torch.nn as nn
+    import torch.optim as optim
+    from torch.utils.data import DataLoader
+
+    from models.model import ImageClassifier
+    from scripts.train_model import build_augmentation, train_one_epoch, evaluate
+    from utils.augment import normalize_batch
+    from utils.dataset_cache import CachedImageDataset, load_dataset_cache
+
+    torch.set_num_threads(threads)
+    torch.manual_seed(seed + trial_id)
+
+    images, labels, classes = load_dataset_cache(cache_dir)
+    # Items stay uint8; augmentation runs on whole batches
+    train_data = CachedImageDataset(images, labels, train_idx)
+    val_data = CachedImageDataset(images, labels, val_idx)
+    augmentation = build_augmentation(trial_augmentation(params))
+    train_loader = DataLoader(train_data, batch_size=params['batch_size'], shuffle=True)
+    val_loader = DataLoader(val_data, batch_size=64)
+
+    device = torch.device("cpu")
+    model = ImageClassifier(num_classes=len(classes)).to(device)
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(model.parameters(), lr=params['learning_rate'])
+
+    history = []
+    best_accuracy = -1.0
+    pruned = False
+    os.makedirs(trial_dir, exist_ok=True)
+    model_path = os.path.join(trial_dir, 'model.pth')
+
+    for epoch in range(1, params['epochs'] + 1):
+        epoch_start = time.perf_counter()
+        running_loss, num_batches, correct, total = train_one_epoch(
+            model, train_loader, criterion, optimizer, device, batch_transform=augmentation)
+        val_accuracy = evaluate(model, val_loader, device, normalize_batch)
+        history.append({
+            'epoch': epoch,
+            'loss': running_loss / max(num_batches, 1),
+            'accuracy': 100 * correct / max(total, 1),
+            'val_accuracy': val_accuracy,
+            'epoch_time': time.perf_counter() - epoch_start
+        })
+
+        if val_accuracy > best_accuracy:
+            best_accuracy = val_accuracy
+            torch.save(model.state_dict(), model_path)
+
+        if pruner is not None and epoch < params['epochs'] and pruner.should_prune(epoch, val_accuracy):
+            pruned = True
+            break
+
+    return {
+        'trial': trial_id,
+        'params': params,
+        'best_val_accuracy': best_accuracy,
+        'epochs_run': len(history),
+        'pruned': pruned,
+        'history': history,
+        'model_path': model_path
+    }
+
+def run_sweep(project_name, strategy='random', n_trials=10, cpu_budget=None,
+              threads_per_trial=1, val_split=0.2, space=None, prune=True, seed=0,
+              max_trials=MAX_TRIALS):
+    """
+    Run a hyperparameter sweep and promote the best trial's model.
+
+    The dataset is decoded once into a shared memory-mapped cache. Trials
+    run in parallel, at most cpu_budget // threads_per_trial at a time, and
+    unpromising trials are stopped early by a median pruner. Trials write
+    their weights under projects/<name>/sweeps/<id>/, so the project's
+    model.pth is only replaced by the winner; once it is stored as a model
+    version, the trial weights are deleted and only results.json is kept.
+
+    Args:
+        project_name: Name of the project to tune
+        strategy: 'grid' or 'random'
+        n_trials: Number of random trials (ignored for grid search)
+        cpu_budget: Total CPU threads the sweep may use (default: all cores)
+        threads_per_trial: Torch threads per trial
+        val_split: Fraction of images held out for validation
+        space: Search space overriding DEFAULT_SEARCH_SPACE (or, for grid
+            search, DEFAULT_GRID) entries
+        prune: Enable median pruning
+        seed: Random seed for sampling and the train/validation split
+        max_trials: Refuse sweeps with more trials than this
+
+    Returns:
+        Sweep summary dict, or None if the sweep could not run
+    """
+    from utils.dataset_cache import build_dataset_cache, load_dataset_cache
+
+    project_dir = os.path.join('projects', project_name)
+    config_path = os.path.join(project_dir, 'config.json')
+    if not os.path.exists(config_path):
+        print(f"Error: Project '{project_name}' not found!")
+        return None
+
+    try:
+        trials = plan_trials(strategy, n_trials, space, seed, max_trials)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return None
+
+    cpu_budget = cpu_budget or os.cpu_count() or 1
+    parallel = max(1, cpu_budget // threads_per_trial)
+
+    sweep_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    sweep_dir = os.path.join(project_dir, 'sweeps', sweep_id)
+    os.makedirs(sweep_dir, exist_ok=True)
+
+    print(f"\n{'='*60}")
+    print(f"Sweep {sweep_id} for project: {project_name}")
+    print(f"Strategy: {strategy}, trials: {len(trials)}, parallel: {parallel}")
+    print(f"{'='*60}\n")
+
+    # Decode the dataset once; every trial memory-maps the same cache
+    cache_dir = build_dataset_cache(os.path.join(project_dir, 'dataset'),
+                                    os.path.join(project_dir, 'cache'), IMAGE_SIZE)
+    _, labels, classes = load_dataset_cache(cache_dir)
+    if len(labels) < 2:
+        print("Error: Not enough images to hold out a validation set")
+        return None
+
+    indices = list(range(len(labels)))
+    random.Random(seed).shuffle(indices)
+    num_val = min(len(indices) - 1, max(1, int(len(indices) * val_split)))
+    val_idx, train_idx = indices[:num_val], indices[num_val:]
+
+    results = []
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Manager() as manager:
+        pruner = MedianPruner(manager.dict(), manager.Lock()) if prune else None
+        with ProcessPoolExecutor(max_workers=parallel, mp_context=ctx) as executor:
+            futures = [
+                executor.submit(_run_trial, trial_id, params, cache_dir, train_idx, val_idx,
+                                os.path.join(sweep_dir, f"trial_{trial_id:03d}"),
+                                threads_per_trial, pruner, seed)
+                for trial_id, params in enumerate(trials)
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                status = 'pruned' if result['pruned'] else 'done'
+                print(f"Trial {result['trial']:03d} {status} after {result['epochs_run']} epochs: "
+                      f"val accuracy {result['best_val_accuracy']:.2f}% {result['params']}")
+
+    results.sort(key=lambda r: r['trial'])
+    best = max(results, key=lambda r: r['best_val_accuracy'])
+    version = _promote_trial(project_dir, best, classes)
+
+    # The winner is stored as a model version now, so only results.json is kept
+    for result in results:
+        model_path = result.pop('model_path')
+        if os.path.exists(model_path):
+            os.remove(model_path)
+        if not os.listdir(os.path.dirname(model_path)):
+            os.rmdir(os.path.dirname(model_path))
+
+    summary = {
+        'sweep_id': sweep_id,
+        'strategy': strategy,
+        'best_trial': best['trial'],
+        'best_params': best['params'],
+        'best_val_accuracy': best['best_val_accuracy'],
+        'model_version': version,
+        'trials': results
+    }
+    with open(os.path.join(sweep_dir, 'results.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\n{'='*60}")
+    print(f"✅ Sweep Complete! Best trial {best['trial']:03d}: "
+          f"{best['best_val_accuracy']:.2f}% {best['params']}")
+    print(f"{'='*60}\n")
+
+    return summary
+
+def _promote_trial(project_dir, trial, classes):
+    """
+    Store a trial's weights as a new model version, promote it and update config.json.
+
+    Returns:
+        Version id
+    """
+    from utils.model_store import save_and_promote
+
+    params = trial['params']
+    training_params = {
+        'epochs': params['epochs'],
+        'batch_size': params['batch_size'],
+        'learning_rate': params['learning_rate'],
+        'augmentation': trial_augmentation(params)
+    }
+    model_dir = os.path.join(project_dir, 'models')
+    with open(os.path.join(model_dir, 'class_labels.json'), 'w') as f:
+        json.dump(classes, f, indent=2)
+
+    # Promotion updates config.json once the weights are in place
+    version, model_path = save_and_promote(project_dir, trial['model_path'], classes,
+                                           {'training_params': training_params,
+                                            'sweep_trial': trial['trial']},
+                                           {'training_history': trial['history'],
+                                            'training_params': training_params})
+
+    print(f"✅ Promoted trial {trial['trial']:03d} as version {version}: {model_path}")
+    return version
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a hyperparameter sweep for a project')
+    parser.add_argument('--project', type=str, required=True, help='Project name')
+    parser.add_argument('--strategy', choices=['grid', 'random'], default='random', help='Search strategy')
+    parser.add_argument('--trials', type=int, default=10, help='Number of random trials')
+    parser.add_argument('--cpu_budget', type=int, default=None, help='CPU threads the sweep may use')
+    parser.add_argument('--threads_per_trial', type=int, default=1, help='Torch threads per trial')
+    parser.add_argument('--val_split', type=float, default=0.2, help='Validation fraction')
+    parser.add_argument('--space', type=str, default=None,
+                        help='JSON object overriding search space entries, e.g. \'{"epochs": [5, 10]}\'')
+    parser.add_argument('--no_prune', action='store_true', help='Disable early pruning')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--max_trials', type=int, default=MAX_TRIALS,
+                        help=f'Refuse sweeps with more trials than this (default: {MAX_TRIALS})')
+
+    args = parser.parse_args()
+
+    summary = run_sweep(
+        project_name=args.project,
+        strategy=args.strategy,
+        n_trials=args.trials,
+        cpu_budget=args.cpu_budget,
+        threads_per_trial=args.threads_per_trial,
+        val_split=args.val_split,
+        space=json.loads(args.space) if args.space else None,
+        prune=not args.no_prune,
+        seed=args.seed,
+        max_trials=args.max_trials
+    )
+
+    sys.exit(0 if summary else 1)
@@ -1,11 +1,18 @@
 import torch
 import torch.nn as nn
 import torch.optim as optim
+import torch.distributed as dist
+import torch.multiprocessing as mp
 import torchvision.transforms as transforms
 import torchvision.datasets as datasets
-from torch.utils.data import DataLoader
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader, WeightedRandomSampler
+from torch.utils.data.distributed import DistributedSampler
 import os
 import json
+import time
+import uuid
+import tempfile
 import argparse
 from pathlib import Path
 import sys
@@ -14,13 +21,226 @@ import sys
 sys.path.append(str(Path(__file__).parent.parent))
 
 from models.model import ImageClassifier
+from utils.augment import BatchAugmentation
+from utils.dataset_cache import ShardDataset
+from utils.model_store import save_version, promote as promote_version
+from config import (IMAGE_SIZE, RANDOM_HORIZONTAL_FLIP, RANDOM_ROTATION, COLOR_JITTER,
+                    ARCHIVE_SHUFFLE_BUFFER)
 
-def train_model(project_name, epochs=10, batch_size=32, learning_rate=0.001):
-    """Train a custom image classification model"""
+def default_augmentation():
+    """Augmentation settings from config.py"""
+    return {
+        'horizontal_flip': RANDOM_HORIZONTAL_FLIP,
+        'rotation': RANDOM_ROTATION,
+        'color_jitter': dict(COLOR_JITTER)
+    }
     
-    # Set device
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    print(f"Using device: {device}")
+def build_augmentation(augmentation=None):
+    """
+    Build the batch-level training augmentation.
+
+    Args:
+        augmentation: Dict with horizontal_flip, rotation (degrees) and
+            color_jitter (brightness/contrast/saturation strengths);
+            defaults to config.py
+
+    Returns:
+        BatchAugmentation applied to whole uint8 batches in train_one_epoch
+    """
+    if augmentation is None:
+        augmentation = default_augmentation()
+    return BatchAugmentation.from_settings(augmentation)
+
+# Per-image work in the loader is only decode and resize; images stay uint8
+# until the batch reaches the device
+load_transform = transforms.Compose([transforms.Resize(IMAGE_SIZE), transforms.PILToTensor()])
+
+def class_balanced_sampler(targets, class_counts=None, num_samples=None, seed=None):
+    """
+    Sample images with probability inversely proportional to their class size,
+    so every class is seen about equally often per epoch.
+
+    Args:
+        targets: Class index of every image
+        class_counts: Images per class index; counted from targets if None
+        num_samples: Draws per epoch (default: len(targets))
+        seed: Seed for the sampler's own generator, e.g. the process rank
+
+    Returns:
+        WeightedRandomSampler drawing with replacement
+    """
+    targets = torch.as_tensor(targets)
+    if class_counts is None:
+        class_counts = torch.bincount(targets).tolist()
+    class_weights = torch.tensor([1.0 / max(count, 1) for count in class_counts], dtype=torch.double)
+    generator = None
+    if seed is not None:
+        generator = torch.Generator()
+        generator.manual_seed(seed)
+    return WeightedRandomSampler(class_weights[targets], num_samples or len(targets),
+                                 replacement=True, generator=generator)
+
+def train_one_epoch(model, loader, criterion, optimizer, device, progress=None, batch_transform=None):
+    """
+    Run one training epoch.
+
+    Args:
+        progress: Optional callable(batch_index, num_batches, loss) invoked
+            every 10 batches
+        batch_transform: Optional callable applied to each batch on the
+            device, e.g. a BatchAugmentation
+
+    Returns:
+        tuple: (summed loss, number of batches, correct predictions, images seen)
+    """
+    model.train()
+    running_loss = 0.0
+    correct = 0
+    total = 0
+
+    for i, (images, labels) in enumerate(loader):
+        images, labels = images.to(device), labels.to(device)
+        if batch_transform is not None:
+            images = batch_transform(images)
+
+        # Forward pass
+        outputs = model(images)
+        loss = criterion(outputs, labels)
+
+        # Backward pass (DDP allreduces the gradients here)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+        # Statistics
+        running_loss += loss.item()
+        _, predicted = torch.max(outputs.data, 1)
+        total += labels.size(0)
+        correct += (predicted == labels).sum().item()
+
+        if progress is not None and (i + 1) % 10 == 0:
+            progress(i + 1, len(loader), loss.item())
+
+    return running_loss, len(loader), correct, total
+
+def evaluate(model, loader, device, batch_transform=None):
+    """Return the accuracy (in %) of a model on a data loader"""
+    model.eval()
+    correct = 0
+    total = 0
+    with torch.no_grad():
+        for images, labels in loader:
+            images = images.to(device)
+            if batch_transform is not None:
+                images = batch_transform(images)
+            outputs = model(images)
+            correct += (outputs.argmax(1).cpu() == labels).sum().item()
+            total += labels.size(0)
+    return 100 * correct / max(total, 1)
+
+def train_model(project_name, epochs=10, batch_size=32, learning_rate=0.001,
+                procs=1, nnodes=1, node_rank=0, rendezvous=None, promote=True, balanced=False,
+                shards=None):
+    """
+    Train a custom image classification model.
+
+    With procs > 1 (or nnodes > 1) training runs data-parallel: one process
+    per shard of the dataset, gradients allreduced over the gloo backend.
+    `batch_size` stays the global batch size, so results are comparable
+    with a single-process run.
+
+    Args:
+        project_name: Name of the project to train
+        epochs: Number of epochs
+        batch_size: Global batch size (split across all processes)
+        learning_rate: Optimizer learning rate
+        procs: Number of training processes on this host
+        nnodes: Number of hosts taking part in training
+        node_rank: Index of this host, 0 to nnodes - 1
+        rendezvous: Shared file path (or tcp:// URL) used to find peers;
+            required when nnodes > 1
+        promote: Serve the new model version right away; when False it is
+            only stored, e.g. to try it as a canary or shadow first
+        balanced: Sample images inversely to their class size instead of
+            uniformly, for datasets with skewed class counts
+        shards: Project archive directory (see utils.archive) to stream the
+            training images from instead of the project's dataset folder
+
+    Returns:
+        True if training succeeded
+    """
+    world_size = procs * nnodes
+    if world_size <= 1:
+        return _train(0, project_name, epochs, batch_size, learning_rate, promote=promote,
+                      balanced=balanced, shards=shards)
+
+    cleanup_rendezvous = False
+    if rendezvous is None:
+        if nnodes > 1:
+            print("Error: --rendezvous is required when training across hosts")
+            return False
+        rendezvous = os.path.join(tempfile.gettempdir(), f"ddp_{project_name}_{uuid.uuid4().hex}")
+        cleanup_rendezvous = True
+    init_method = rendezvous if '://' in rendezvous else f"file://{os.path.abspath(rendezvous)}"
+
+    dist_args = {
+        'init_method': init_method,
+        'world_size': world_size,
+        'node_rank': node_rank,
+        'procs': procs,
+        'balanced': balanced,
+        'shards': shards,
+    }
+
+    try:
+        mp.spawn(_train_worker,
+                 args=(project_name, epochs, batch_size, learning_rate, promote, dist_args),
+                 nprocs=procs, join=True)
+        return True
+    except Exception as e:
+        print(f"Error: distributed training failed: {e}")
+        return False
+    finally:
+        if cleanup_rendezvous and os.path.exists(rendezvous):
+            os.remove(rendezvous)
+
+def _train_worker(local_rank, project_name, epochs, batch_size, learning_rate, promote, dist_args):
+    """Entry point of one spawned data-parallel training process"""
+    rank = dist_args['node_rank'] * dist_args['procs'] + local_rank
+
+    # Keep the processes on this host from oversubscribing the cores
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // dist_args['procs']))
+
+    dist.init_process_group(backend='gloo', init_method=dist_args['init_method'],
+                            rank=rank, world_size=dist_args['world_size'])
+    try:
+        success = _train(rank, project_name, epochs, batch_size, learning_rate,
+                         world_size=dist_args['world_size'], promote=promote,
+                         balanced=dist_args['balanced'], shards=dist_args['shards'])
+    finally:
+        dist.destroy_process_group()
+
+    if not success:
+        sys.exit(1)
+
+def _train(rank, project_name, epochs, batch_size, learning_rate, world_size=1, promote=True,
+           balanced=False, shards=None):
+    """Training loop shared by the single-process and data-parallel paths"""
+    distributed = world_size > 1
+    is_main = rank == 0
+
+    def log(*args, **kwargs):
+        if is_main:
+            print(*args, **kwargs)
+
+    # Set device; gloo allreduce runs on CPU tensors
+    if distributed:
+        device = torch.device("cpu")
+    else:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    log(f"Using device: {device}")
+    if distributed:
+        log(f"Data-parallel training with {world_size} processes (gloo)")
     
     # Project paths
     project_dir = os.path.join('projects', project_name)
@@ -32,25 +252,41 @@ def train_model(project_name, epochs=10, batch_size=32, learning_rate=0.001):
     with open(config_path, 'r') as f:
         config = json.load(f)
     
-    print(f"\n{'='*60}")
-    print(f"Training Project: {project_name}")
-    print(f"{'='*60}\n")
+    log(f"\n{'='*60}")
+    log(f"Training Project: {project_name}")
+    log(f"{'='*60}\n")
+    
+    # Augmentation runs on whole batches in train_one_epoch
+    augmentation = default_augmentation()
+    batch_augmentation = build_augmentation(augmentation)
     
-    # Define image transformations
-    transform = transforms.Compose([
-        transforms.Resize((128, 128)),
-        transforms.RandomHorizontalFlip(),
-        transforms.RandomRotation(10),
-        transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
-    ])
-    
-    # Load dataset
-    print(f"Loading dataset from: {dataset_dir}")
+    # Load dataset; each process only iterates over its own shard
+    log(f"Loading dataset from: {shards or dataset_dir}")
     try:
-        train_data = datasets.ImageFolder(root=dataset_dir, transform=transform)
-        train_loader = DataLoader(dataset=train_data, batch_size=batch_size, shuffle=True)
+        sampler = None
+        if shards:
+            if balanced:
+                print("Error: --balanced is not supported when training from shards")
+                return False
+            # Sequential reads of the tar shards, shuffled through a buffer; the
+            # dataset splits the images between processes itself
+            train_data = ShardDataset(shards, load_transform, rank, world_size,
+                                      ARCHIVE_SHUFFLE_BUFFER)
+        else:
+            train_data = datasets.ImageFolder(root=dataset_dir, transform=load_transform)
+            if balanced:
+                # Weighted by the images actually found rather than the counts
+                # tracked on upload, which go stale when files change on disk.
+                # Each process draws its share independently
+                sampler = class_balanced_sampler(train_data.targets,
+                                                 num_samples=-(-len(train_data) // world_size),
+                                                 seed=rank if distributed else None)
+            elif distributed:
+                sampler = DistributedSampler(train_data, num_replicas=world_size, rank=rank,
+                                             shuffle=True)
+        local_batch_size = max(1, batch_size // world_size)
+        train_loader = DataLoader(dataset=train_data, batch_size=local_batch_size,
+                                  shuffle=sampler is None and not shards, sampler=sampler)
     except Exception as e:
         print(f"Error loading dataset: {e}")
         return False
@@ -58,75 +294,91 @@ def train_model(project_name, epochs=10, batch_size=32, learning_rate=0.001):
     # Get class names
     class_labels = train_data.classes
     num_classes = len(class_labels)
-    print(f"\nClasses found: {class_labels}")
-    print(f"Number of classes: {num_classes}")
-    print(f"Total training images: {len(train_data)}\n")
+    log(f"\nClasses found: {class_labels}")
+    log(f"Number of classes: {num_classes}")
+    log(f"Total training images: {len(train_data)}\n")
     
     # Update config with class info
     config['classes'] = class_labels
     config['num_classes'] = num_classes
     
-    # Initialize model
+    # Initialize model; DDP broadcasts rank 0's initial weights to every process
     model = ImageClassifier(num_classes=num_classes).to(device)
+    if distributed:
+        model = DistributedDataParallel(model)
     
     # Define loss function & optimizer
     criterion = nn.CrossEntropyLoss()
     optimizer = optim.Adam(model.parameters(), lr=learning_rate)
     
     # Training loop
-    print(f"Starting training for {epochs} epochs...\n")
+    log(f"Starting training for {epochs} epochs...\n")
     training_history = []
     
     for epoch in range(epochs):
-        model.train()
-        running_loss = 0.0
-        correct = 0
-        total = 0
+        for source in (sampler, train_data):
+            if hasattr(source, 'set_epoch'):
+                source.set_epoch(epoch)
+        epoch_start = time.perf_counter()
         
-        for i, (images, labels) in enumerate(train_loader):
-            images, labels = images.to(device), labels.to(device)
+        def progress(batch, num_batches, loss):
+            log(f"Epoch [{epoch+1}/{epochs}], Batch [{batch}/{num_batches}], Loss: {loss:.4f}")
             
-            # Forward pass
-            outputs = model(images)
-            loss = criterion(outputs, labels)
-            
-            # Backward pass
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
+        running_loss, num_batches, correct, total = train_one_epoch(
+            model, train_loader, criterion, optimizer, device, progress, batch_augmentation)
             
-            # Statistics
-            running_loss += loss.item()
-            _, predicted = torch.max(outputs.data, 1)
-            total += labels.size(0)
-            correct += (predicted == labels).sum().item()
-            
-            # Print progress every 10 batches
-            if (i + 1) % 10 == 0:
-                print(f"Epoch [{epoch+1}/{epochs}], Batch [{i+1}/{len(train_loader)}], "
-                      f"Loss: {loss.item():.4f}")
-        
-        # Epoch statistics
-        epoch_loss = running_loss / len(train_loader)
+        # Epoch statistics, summed over all processes
+        if distributed:
+            stats = torch.tensor([running_loss, num_batches, correct, total], dtype=torch.float64)
+            dist.all_reduce(stats, op=dist.ReduceOp.SUM)
+            running_loss, num_batches, correct, total = stats.tolist()
+        epoch_time = time.perf_counter() - epoch_start
+        epoch_loss = running_loss / num_batches
         epoch_acc = 100 * correct / total
-        
-        print(f"\n{'='*60}")
-        print(f"Epoch [{epoch+1}/{epochs}] Summary:")
-        print(f"Average Loss: {epoch_loss:.4f}")
-        print(f"Training Accuracy: {epoch_acc:.2f}%")
-        print(f"{'='*60}\n")
+        images_per_sec = total / epoch_time
+            
+        log(f"\n{'='*60}")
+        log(f"Epoch [{epoch+1}/{epochs}] Summary:")
+        log(f"Average Loss: {epoch_loss:.4f}")
+        log(f"Training Accuracy: {epoch_acc:.2f}%")
+        log(f"Throughput: {images_per_sec:.1f} images/sec")
+        log(f"{'='*60}\n")
         
         # Save epoch stats
         training_history.append({
             'epoch': epoch + 1,
             'loss': epoch_loss,
-            'accuracy': epoch_acc
+            'accuracy': epoch_acc,
+            'epoch_time': epoch_time,
+            'images_per_sec': images_per_sec
         })
     
-    # Save model
-    model_path = os.path.join(model_dir, 'model.pth')
-    torch.save(model.state_dict(), model_path)
-    print(f"\n✅ Model saved to: {model_path}")
+    # Only rank 0 writes the model and config
+    if not is_main:
+        return True
+
+    # Save model as a new version
+    state_dict = model.module.state_dict() if distributed else model.state_dict()
+    training_params = {
+        'epochs': epochs,
+        'batch_size': batch_size,
+        'learning_rate': learning_rate,
+        'world_size': world_size,
+        'augmentation': augmentation,
+        'balanced': balanced
+    }
+    weights_path = os.path.join(model_dir, f"model.{os.getpid()}.tmp")
+    torch.save(state_dict, weights_path)
+    try:
+        version = save_version(project_dir, weights_path, class_labels,
+                               {'training_params': training_params})
+    finally:
+        os.remove(weights_path)
+    print(f"\n✅ Model saved as version: {version}")
+
+    if not promote:
+        print(f"Version {version} was not promoted; the current model keeps serving")
+        return True
     
     # Save class labels
     labels_path = os.path.join(model_dir, 'class_labels.json')
@@ -134,18 +386,12 @@ def train_model(project_name, epochs=10, batch_size=32, learning_rate=0.001):
         json.dump(class_labels, f, indent=2)
     print(f"✅ Class labels saved to: {labels_path}")
     
-    # Update config
-    config['trained'] = True
-    config['model_path'] = model_path
-    config['training_history'] = training_history
-    config['training_params'] = {
-        'epochs': epochs,
-        'batch_size': batch_size,
-        'learning_rate': learning_rate
-    }
-    
-    with open(config_path, 'w') as f:
-        json.dump(config, f, indent=2)
+    # Serve the new weights, then update config in one atomic replace
+    model_path = promote_version(project_dir, version, {
+        'training_history': training_history,
+        'training_params': training_params
+    })
+    print(f"✅ Model promoted to: {model_path}")
     
     print(f"\n{'='*60}")
     print(f"✅ Training Complete!")
@@ -159,6 +405,18 @@ if __name__ == "__main__":
     parser.add_argument('--epochs', type=int, default=10, help='Number of epochs')
     parser.add_argument('--batch_size', type=int, default=32, help='Batch size')
     parser.add_argument('--learning_rate', type=float, default=0.001, help='Learning rate')
+    parser.add_argument('--procs', type=int, default=1,
+                        help='Number of data-parallel training processes on this host')
+    parser.add_argument('--nnodes', type=int, default=1, help='Number of hosts taking part in training')
+    parser.add_argument('--node_rank', type=int, default=0, help='Index of this host (0 to nnodes - 1)')
+    parser.add_argument('--rendezvous', type=str, default=None,
+                        help='Shared file path or tcp:// URL used by the processes to find each other')
+    parser.add_argument('--no_promote', action='store_true',
+                        help='Store the trained model as a new version without serving it')
+    parser.add_argument('--balanced', action='store_true',
+                        help='Sample images inversely to their class size')
+    parser.add_argument('--shards', type=str, default=None,
+                        help='Project archive directory to stream training images from')
     
     args = parser.parse_args()
     
@@ -166,7 +424,14 @@ if __name__ == "__main__":
         project_name=args.project,
         epochs=args.epochs,
         batch_size=args.batch_size,
-        learning_rate=args.learning_rate
+        learning_rate=args.learning_rate,
+        procs=args.procs,
+        nnodes=args.nnodes,
+        node_rank=args.node_rank,
+        rendezvous=args.rendezvous,
+        promote=not args.no_promote,
+        balanced=args.balanced,
+        shards=args.shards
     )
     
     sys.exit(0 if success else 1)
@@ -0,0 +1,328 @@
+import io
+import json
+import os
+import tarfile
+
+import pytest
+
+from utils.archive import (INDEX_NAME, _member_path, archive_sources, export_project,
+                           import_archive, iter_shard, plan_archive, read_index)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+@pytest.fixture
+def project(tmp_path):
+    """Untrained project with two classes, plus files that must not be archived"""
+    project_dir = tmp_path / 'projects' / 'src'
+    _write(str(project_dir / 'config.json'), json.dumps({
+        'name': 'src', 'classes': ['cat', 'dog'], 'num_classes': 2,
+        'trained': False, 'model_path': None
+    }).encode())
+    for class_name in ('cat', 'dog'):
+        for i in range(5):
+            _write(str(project_dir / 'dataset' / class_name / f'{i}.jpg'),
+                   f'{class_name}-{i}'.encode() * 40)
+    _write(str(project_dir / 'cache' / 'images.npy'), b'derived')
+    _write(str(project_dir / 'sweeps' / 'abc' / 'trial_000' / 'model.pth'), b'trial weights')
+    _write(str(project_dir / 'dataset' / '.hidden.jpg'), b'hidden')
+    _write(str(project_dir / 'models' / 'model.safetensors'), b'derived weights')
+    return str(project_dir)
+
+
+def _tree(root):
+    files = {}
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(dirpath, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, root)] = f.read()
+    return files
+
+
+def test_plan_archive_shards_and_excludes(project):
+    index = plan_archive(project, shard_size=500)
+
+    assert index['classes'] == ['cat', 'dog']
+    assert index['num_samples'] == 10
+    assert len(index['shards']) > 1
+    assert index['shards'][0]['files'][0][0] == 'config.json'
+
+    archived = [rel_path for shard in index['shards'] for rel_path, _ in shard['files']]
+    assert not any(p.startswith(('cache/', 'sweeps/')) or p.endswith('.safetensors') or '/.' in p
+                   for p in archived)
+    assert sum(shard['samples'] for shard in index['shards']) == 10
+
+
+def test_iter_shard_is_a_complete_tar(project):
+    files = plan_archive(project)['shards'][0]['files']
+    data = b''.join(iter_shard(project, files))
+
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        assert tar.getnames() == [rel_path for rel_path, _ in files]
+
+
+def test_export_import_round_trip(project, tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    index = export_project(project, archive_dir, shard_size=500)
+    assert read_index(archive_dir) == index
+
+    project_dir = str(tmp_path / 'projects' / 'copy')
+    import_archive(archive_sources(archive_dir), project_dir)
+
+    expected = {path: data for path, data in _tree(project).items()
+                if path.startswith('dataset') and '.hidden' not in path}
+    imported = _tree(project_dir)
+    assert {p: d for p, d in imported.items() if p.startswith('dataset')} == expected
+    with open(os.path.join(project_dir, 'config.json')) as f:
+        config = json.load(f)
+    assert config['name'] == 'copy'
+    assert config['trained'] is False
+    assert not any(name.endswith('.safetensors') for name in imported)
+    # Nothing is left over next to the project
+    assert sorted(os.listdir(tmp_path / 'projects')) == ['copy', 'src']
+
+
+def test_import_concatenated_stream(project, tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    export_project(project, archive_dir, shard_size=500)
+    stream = io.BytesIO(b''.join(open(path, 'rb').read()
+                                 for path in archive_sources(archive_dir)))
+
+    project_dir = str(tmp_path / 'projects' / 'streamed')
+    import_archive([stream], project_dir)
+    assert len(os.listdir(os.path.join(project_dir, 'dataset', 'cat'))) == 5
+    assert len(os.listdir(os.path.join(project_dir, 'dataset', 'dog'))) == 5
+
+
+def test_import_shards_with_append(project, tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    export_project(project, archive_dir, shard_size=500)
+    first, *rest = archive_sources(archive_dir)
+    assert rest
+
+    project_dir = str(tmp_path / 'projects' / 'appended')
+    import_archive([first], project_dir)
+    for source in rest:
+        import_archive([source], project_dir, append=True)
+
+    dataset = {p: d for p, d in _tree(project_dir).items() if p.startswith('dataset')}
+    assert len(dataset) == 10
+
+
+def test_import_rejects_existing_and_missing_projects(project, tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    export_project(project, archive_dir)
+
+    with pytest.raises(ValueError):
+        import_archive(archive_sources(archive_dir), project)
+    with pytest.raises(ValueError):
+        import_archive(archive_sources(archive_dir), str(tmp_path / 'projects' / 'none'),
+                       append=True)
+
+
+def test_import_without_config_leaves_nothing_behind(project, tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    export_project(project, archive_dir, shard_size=500)
+
+    with pytest.raises(ValueError):
+        import_archive(archive_sources(archive_dir)[1:], str(tmp_path / 'projects' / 'partial'))
+    assert sorted(os.listdir(tmp_path / 'projects')) == ['src']
+
+
+def _member(name, type_=tarfile.REGTYPE):
+    info = tarfile.TarInfo(name)
+    info.type = type_
+    return info
+
+
+@pytest.mark.parametrize('name', [
+    '../escape.jpg',
+    'dataset/../../escape.jpg',
+    '/etc/passwd',
+    'dataset/.hidden/1.jpg',
+    '.config.json',
+])
+def test_member_path_rejects_unsafe_names(name):
+    assert _member_path(_member(name)) is None
+
+
+def test_member_path_rejects_links_and_directories():
+    assert _member_path(_member('dataset/cat/1.jpg', tarfile.SYMTYPE)) is None
+    assert _member_path(_member('dataset/cat/1.jpg', tarfile.LNKTYPE)) is None
+    assert _member_path(_member('dataset/cat', tarfile.DIRTYPE)) is None
+
+
+def test_member_path_accepts_project_files():
+    assert _member_path(_member('dataset/cat/1.jpg')) == os.path.join('dataset', 'cat', '1.jpg')
+    assert _member_path(_member('config.json')) == 'config.json'
+
+
+def test_hostile_archive_extracts_only_safe_members(tmp_path):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for name, data in [('config.json', json.dumps({'name': 'x', 'classes': []}).encode()),
+                           ('../outside.txt', b'escape'),
+                           (str(tmp_path / 'absolute.txt'), b'escape'),
+                           ('dataset/.hidden.jpg', b'hidden'),
+                           ('dataset/cat/1.jpg', b'image')]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        link = tarfile.TarInfo('dataset/cat/link.jpg')
+        link.type = tarfile.SYMTYPE
+        link.linkname = '/etc/passwd'
+        tar.addfile(link)
+    buffer.seek(0)
+
+    project_dir = tmp_path / 'projects' / 'hostile'
+    import_archive([buffer], str(project_dir))
+
+    assert set(_tree(str(project_dir))) == {'config.json', os.path.join('dataset', 'cat', '1.jpg')}
+    assert not (tmp_path / 'projects' / 'outside.txt').exists()
+    assert not (tmp_path / 'absolute.txt').exists()
+
+
+def test_import_rejects_pickled_weights(tmp_path):
+    torch = pytest.importorskip('torch')
+
+    class Payload:
+        def __reduce__(self):
+            return (os.system, ('touch ' + str(tmp_path / 'pwned'),))
+
+    weights_path = str(tmp_path / 'model.pth')
+    torch.save({'fc3.bias': torch.zeros(2), 'payload': Payload()}, weights_path)
+
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        data = json.dumps({'name': 'x', 'classes': ['a', 'b'], 'trained': True,
+                           'model_path': 'projects/x/models/model.pth'}).encode()
+        info = tarfile.TarInfo('config.json')
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+        tar.add(weights_path, arcname='models/model.pth')
+    buffer.seek(0)
+
+    with pytest.raises(ValueError):
+        import_archive([buffer], str(tmp_path / 'projects' / 'x'))
+    assert not (tmp_path / 'pwned').exists()
+    assert not (tmp_path / 'projects' / 'x').exists()
+
+
+def test_import_checks_and_installs_weights(tmp_path):
+    torch = pytest.importorskip('torch')
+    from models.model import ImageClassifier
+
+    project_dir = tmp_path / 'projects' / 'src'
+    _write(str(project_dir / 'config.json'), json.dumps({
+        'name': 'src', 'classes': ['a', 'b'], 'num_classes': 2, 'trained': True,
+        'model_path': 'projects/src/models/model.pth'
+    }).encode())
+    _write(str(project_dir / 'dataset' / 'a' / '1.jpg'), b'image')
+    os.makedirs(project_dir / 'models')
+    torch.save(ImageClassifier(num_classes=2).state_dict(), str(project_dir / 'models' / 'model.pth'))
+
+    archive_dir = str(tmp_path / 'archive')
+    export_project(str(project_dir), archive_dir)
+    imported = tmp_path / 'projects' / 'copy'
+    import_archive(archive_sources(archive_dir), str(imported))
+
+    assert (imported / 'models' / 'model.pth').exists()
+    assert (imported / 'models' / 'model.safetensors').exists()
+    with open(imported / 'config.json') as f:
+        config = json.load(f)
+    assert config['trained'] is True
+    assert config['model_path'] == os.path.join(str(imported), 'models', 'model.pth')
+
+
+def test_import_rejects_weights_for_other_class_count(tmp_path):
+    torch = pytest.importorskip('torch')
+    from models.model import ImageClassifier
+
+    weights_path = str(tmp_path / 'model.pth')
+    torch.save(ImageClassifier(num_classes=5).state_dict(), weights_path)
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        data = json.dumps({'name': 'x', 'classes': ['a', 'b'], 'trained': True}).encode()
+        info = tarfile.TarInfo('config.json')
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+        tar.add(weights_path, arcname='models/model.pth')
+    buffer.seek(0)
+
+    with pytest.raises(ValueError):
+        import_archive([buffer], str(tmp_path / 'projects' / 'x'))
+    assert not (tmp_path / 'projects' / 'x').exists()
+
+
+def _tar(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    return buffer
+
+
+def test_append_ignores_archive_config(project, tmp_path):
+    with open(os.path.join(project, 'config.json')) as f:
+        config = f.read()
+    hostile = _tar([('config.json', json.dumps({'classes': ['x'],
+                                                'serving': {'ensemble': ['../..']}}).encode()),
+                    ('models/current.json', json.dumps({'version': '../..'}).encode()),
+                    ('dataset/cat/new.jpg', b'image')])
+
+    import_archive([hostile], project, append=True)
+
+    with open(os.path.join(project, 'config.json')) as f:
+        assert f.read() == config
+    assert not os.path.exists(os.path.join(project, 'models', 'current.json'))
+    assert os.path.exists(os.path.join(project, 'dataset', 'cat', 'new.jpg'))
+
+
+def test_import_drops_serving_and_unknown_model_version(tmp_path):
+    config = {'name': 'x', 'classes': ['a', 'b'], 'model_version': '../../../etc',
+              'serving': {'mode': 'off', 'ensemble': ['../../../etc']}}
+    hostile = _tar([('config.json', json.dumps(config).encode()),
+                    ('models/current.json', json.dumps({'version': '../../../etc'}).encode()),
+                    ('models/versions/v1/meta.json', json.dumps({'version': '../../../etc'}).encode())])
+
+    project_dir = tmp_path / 'projects' / 'x'
+    import_archive([hostile], str(project_dir))
+
+    with open(project_dir / 'config.json') as f:
+        imported = json.load(f)
+    assert 'serving' not in imported
+    assert 'model_version' not in imported
+
+
+def test_import_keeps_stored_model_version(tmp_path):
+    torch = pytest.importorskip('torch')
+    from models.model import ImageClassifier
+
+    weights = io.BytesIO()
+    torch.save(ImageClassifier(num_classes=2).state_dict(), weights)
+    archive = _tar([('config.json', json.dumps({'name': 'x', 'classes': ['a', 'b'],
+                                                'model_version': 'v0'}).encode()),
+                    ('models/current.json', json.dumps({'version': 'v1'}).encode()),
+                    ('models/versions/v1/meta.json', json.dumps({'version': 'v1'}).encode()),
+                    ('models/versions/v1/model.pth', weights.getvalue())])
+
+    project_dir = tmp_path / 'projects' / 'x'
+    import_archive([archive], str(project_dir))
+
+    with open(project_dir / 'config.json') as f:
+        assert json.load(f)['model_version'] == 'v1'
+
+
+def test_index_written_last(project, tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    index = export_project(project, archive_dir, shard_size=500)
+    assert sorted(os.listdir(archive_dir)) == sorted(
+        [shard['name'] for shard in index['shards']] + [INDEX_NAME])
@@ -0,0 +1,35 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from utils.augment import BatchAugmentation, normalize_batch
+
+
+def _batch(n=64):
+    torch.manual_seed(0)
+    return torch.randint(0, 256, (n, 3, 16, 16), dtype=torch.uint8)
+
+
+def test_output_is_normalised():
+    images = _batch()
+
+    assert torch.allclose(BatchAugmentation()(images), images.float() / 127.5 - 1)
+
+    augmented = BatchAugmentation(horizontal_flip=True, rotation=20,
+                                  color_jitter={'brightness': 0.4, 'contrast': 0.4,
+                                                'saturation': 0.4})(images)
+    assert augmented.dtype == torch.float32
+    assert augmented.shape == images.shape
+    assert augmented.min() >= -1 and augmented.max() <= 1
+
+
+def test_flips_are_drawn_per_image():
+    images = _batch()
+    torch.manual_seed(1)
+    augmented = BatchAugmentation(horizontal_flip=True)(images)
+
+    plain, flipped = normalize_batch(images), normalize_batch(images.flip(-1))
+    is_plain = [torch.equal(a, p) for a, p in zip(augmented, plain)]
+    is_flipped = [torch.equal(a, f) for a, f in zip(augmented, flipped)]
+    assert all(p != f for p, f in zip(is_plain, is_flipped))
+    assert 0 < sum(is_flipped) < len(images)
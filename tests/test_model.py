@@ -0,0 +1,108 @@
+import json
+import struct
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from models.model import (ImageClassifier, grad_cam, load_model, load_model_mmap,
+                          load_mmap_weights, save_mmap_weights)
+
+
+def _header(path):
+    with open(path, 'rb') as f:
+        header_len = struct.unpack('<Q', f.read(8))[0]
+        return header_len, json.loads(f.read(header_len))
+
+
+def test_mmap_weights_round_trip(tmp_path):
+    state_dict = ImageClassifier(num_classes=3).state_dict()
+    path = str(tmp_path / 'model.safetensors')
+    save_mmap_weights(state_dict, path)
+
+    loaded = load_mmap_weights(path)
+    assert set(loaded) == set(state_dict)
+    for name, tensor in state_dict.items():
+        assert loaded[name].dtype == tensor.dtype
+        assert torch.equal(loaded[name], tensor)
+
+
+def test_mmap_weights_dtypes_and_alignment(tmp_path):
+    state_dict = {
+        'half': torch.randn(3, 5).half(),
+        'long': torch.arange(7, dtype=torch.int64),
+        'float': torch.randn(2, 3),
+        'odd_half': torch.randn(1).half(),
+    }
+    path = str(tmp_path / 'weights.safetensors')
+    save_mmap_weights(state_dict, path)
+
+    header_len, header = _header(path)
+    assert (8 + header_len) % 64 == 0
+    assert {info['dtype'] for info in header.values()} == {'F16', 'I64', 'F32'}
+    for name, info in header.items():
+        begin, end = info['data_offsets']
+        assert begin % state_dict[name].element_size() == 0
+        assert end - begin == state_dict[name].numel() * state_dict[name].element_size()
+
+    loaded = load_mmap_weights(path)
+    for name, tensor in state_dict.items():
+        assert loaded[name].dtype == tensor.dtype
+        assert list(loaded[name].shape) == list(tensor.shape)
+        assert torch.equal(loaded[name], tensor)
+
+
+def test_load_model_mmap_matches_load_model(tmp_path):
+    torch.manual_seed(0)
+    model = ImageClassifier(num_classes=4)
+    # Non-default batch norm statistics, so they must be restored too
+    model.train()
+    with torch.no_grad():
+        model(torch.randn(8, 3, 128, 128))
+    state_dict = model.state_dict()
+
+    weights_path = str(tmp_path / 'model.pth')
+    mmap_path = str(tmp_path / 'model.safetensors')
+    torch.save(state_dict, weights_path)
+    save_mmap_weights(state_dict, mmap_path)
+
+    images = torch.randn(2, 3, 128, 128)
+    with torch.no_grad():
+        expected = load_model(weights_path, 4)(images)
+        actual = load_model_mmap(mmap_path, 4)(images)
+    assert torch.allclose(actual, expected)
+
+
+def _eval_model(num_classes=3):
+    torch.manual_seed(0)
+    return ImageClassifier(num_classes=num_classes).eval()
+
+
+def test_grad_cam_logits_and_heatmaps():
+    model = _eval_model()
+    images = torch.randn(4, 3, 128, 128)
+
+    logits, heatmaps = grad_cam(model, images)
+
+    with torch.no_grad():
+        assert torch.allclose(logits, model(images), atol=1e-5)
+    assert heatmaps.shape == (4, 128, 128)
+    assert heatmaps.min() >= 0 and heatmaps.max() <= 1
+    # Each non-empty heatmap is scaled so its peak is 1
+    peaks = heatmaps.flatten(1).max(dim=1).values
+    assert all(torch.isclose(peak, torch.tensor(1.0)) for peak in peaks if peak > 0)
+
+
+def test_grad_cam_explains_the_requested_classes():
+    model = _eval_model()
+    images = torch.randn(2, 3, 128, 128)
+
+    _, predicted = grad_cam(model, images)
+    _, explained = grad_cam(model, images, target_classes=[0, 1])
+    for i, target in enumerate([0, 1]):
+        _, alone = grad_cam(model, images[i:i + 1], target_classes=[target])
+        assert torch.allclose(explained[i], alone[0], atol=1e-5)
+
+    logits, _ = grad_cam(model, images)
+    _, other = grad_cam(model, images, target_classes=(logits.argmax(dim=1) + 1) % 3)
+    assert not torch.allclose(predicted, other)
@@ -0,0 +1,84 @@
+import json
+import os
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from models.model import ImageClassifier
+from utils.model_store import (current_version, is_version, promote, save_version,
+                               served_model_path, version_model_path)
+
+
+@pytest.fixture
+def project_dir(tmp_path, monkeypatch):
+    """Untrained project with two classes under projects/p, relative to the working directory"""
+    monkeypatch.chdir(tmp_path)
+    project_dir = os.path.join('projects', 'p')
+    os.makedirs(os.path.join(project_dir, 'models'))
+    with open(os.path.join(project_dir, 'config.json'), 'w') as f:
+        json.dump({'name': 'p', 'classes': ['a', 'b'], 'num_classes': 2, 'trained': False}, f)
+    return project_dir
+
+
+def _save(project_dir, tmp_path, classes, seed):
+    torch.manual_seed(seed)
+    weights_path = str(tmp_path / f'weights-{seed}.pth')
+    torch.save(ImageClassifier(num_classes=len(classes)).state_dict(), weights_path)
+    return save_version(project_dir, weights_path, classes)
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_promote_points_everything_at_one_version(project_dir, tmp_path):
+    first = _save(project_dir, tmp_path, ['a', 'b'], seed=0)
+    second = _save(project_dir, tmp_path, ['a', 'b', 'c'], seed=1)
+
+    for version in (first, second):
+        model_path = promote(project_dir, version)
+
+        with open(os.path.join(project_dir, 'config.json')) as f:
+            config = json.load(f)
+        source = version_model_path(project_dir, version)
+        assert config['model_version'] == version == current_version(project_dir)
+        assert config['classes'] == (['a', 'b'] if version == first else ['a', 'b', 'c'])
+        assert served_model_path(project_dir, config) == source
+        assert _read(model_path) == _read(source)
+        assert _read(os.path.join(project_dir, 'models', 'model.safetensors')) == \
+            _read(os.path.splitext(source)[0] + '.safetensors')
+    assert not any(name.endswith('.tmp') for name in os.listdir(os.path.join(project_dir, 'models')))
+
+
+def test_is_version_rejects_unknown_and_unsafe_ids(project_dir, tmp_path):
+    version = _save(project_dir, tmp_path, ['a', 'b'], seed=0)
+
+    assert is_version(project_dir, version)
+    for other in ('../x', '../' + version, 'versions', '', None, ['x']):
+        assert not is_version(project_dir, other)
+    with pytest.raises(ValueError):
+        promote(project_dir, '../x')
+
+
+def test_serving_policy_rejects_ensemble_with_other_classes(project_dir, tmp_path):
+    import app
+
+    first = _save(project_dir, tmp_path, ['a', 'b'], seed=0)
+    same = _save(project_dir, tmp_path, ['a', 'b'], seed=1)
+    other = _save(project_dir, tmp_path, ['a', 'b', 'c'], seed=2)
+    promote(project_dir, first)
+    client = app.app.test_client()
+
+    response = client.post('/api/projects/p/serving', json={'ensemble': [first, other]})
+    assert response.status_code == 400
+    with open(os.path.join(project_dir, 'config.json')) as f:
+        assert 'serving' not in json.load(f)
+
+    response = client.post('/api/projects/p/serving', json={'ensemble': ['../x']})
+    assert response.status_code == 404
+
+    response = client.post('/api/projects/p/serving', json={'ensemble': [first, same]})
+    assert response.status_code == 200
+    assert response.json['serving']['ensemble'] == [first, same]
@@ -0,0 +1,60 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from PIL import Image
+
+from models.model import ImageClassifier
+from utils import predictor
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    torch.manual_seed(0)
+    path = str(tmp_path / 'model.pth')
+    torch.save(ImageClassifier(num_classes=3).state_dict(), path)
+    return path
+
+
+def _images(n):
+    return [Image.new('RGB', (64, 64), color=(40 * i, 255 - 40 * i, 90)) for i in range(n)]
+
+
+def test_explain_batch_matches_predict_batch(model_path):
+    images = _images(3)
+
+    explained = predictor.explain_batch(images, model_path, 3)
+    probabilities = predictor.predict_batch(images, model_path, 3)
+
+    for (probs, heatmap), expected in zip(explained, probabilities):
+        assert probs == pytest.approx(expected, abs=1e-5)
+        assert heatmap.shape == (128, 128)
+        assert heatmap.min() >= 0 and heatmap.max() <= 1
+
+
+def test_explain_batch_answers_repeats_from_cache(model_path, monkeypatch):
+    images = _images(2)
+    keys = [f'{model_path}-{i}' for i in range(2)]
+    first = predictor.explain_batch(images, model_path, 3, keys)
+
+    def no_model(*args, **kwargs):
+        raise AssertionError("cached explanations must not load the model")
+
+    monkeypatch.setattr(predictor, 'get_model', no_model)
+    second = predictor.explain_batch(images, model_path, 3, keys)
+
+    for (probs, heatmap), (cached_probs, cached_heatmap) in zip(first, second):
+        assert (probs == cached_probs).all() and (heatmap == cached_heatmap).all()
+
+
+def test_explain_batch_caches_per_target_class(model_path):
+    images = _images(1)
+    key = [f'{model_path}-target']
+
+    (_, first), = predictor.explain_batch(images, model_path, 3, key, target_classes=[0])
+    (_, second), = predictor.explain_batch(images, model_path, 3, key, target_classes=[1])
+    (_, uncached), = predictor.explain_batch(images, model_path, 3, target_classes=[1])
+
+    # A cached explanation of class 0 is not returned for class 1
+    assert (second == uncached).all()
+    assert not (first == second).all()
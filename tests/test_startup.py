@@ -0,0 +1,19 @@
+import pytest
+
+from scripts.benchmark import (CLI_BUDGET_MS, HEAVY_MODULES, _probe_startup, bench_startup,
+                               check_startup)
+
+
+@pytest.mark.parametrize('module', ['app', 'utils.predictor', 'utils.model_store'])
+def test_import_does_not_load_heavy_modules(module):
+    _, heavy = _probe_startup(f"import {module}", repeats=1)
+    assert heavy == [], f"importing {module} loaded {', '.join(heavy)}"
+
+
+def test_startup_within_budget():
+    metrics, heavy_imports = bench_startup(repeats=3)
+    assert check_startup(metrics, heavy_imports, CLI_BUDGET_MS) == []
+
+
+def test_heavy_modules_cover_torch_and_opencv():
+    assert {'torch', 'cv2'} <= set(HEAVY_MODULES)
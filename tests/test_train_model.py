@@ -0,0 +1,20 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from scripts.train_model import class_balanced_sampler
+
+
+def test_balanced_sampler_draws_classes_uniformly():
+    targets = [0] * 900 + [1] * 90 + [2] * 10
+    sampler = class_balanced_sampler(targets, num_samples=30000, seed=0)
+
+    drawn = torch.bincount(torch.as_tensor(targets)[list(sampler)], minlength=3)
+    assert len(drawn) == 3
+    for count in drawn.tolist():
+        assert count / 30000 == pytest.approx(1 / 3, abs=0.02)
+
+
+def test_balanced_sampler_defaults_to_one_epoch():
+    targets = [0, 0, 0, 1]
+    assert len(list(class_balanced_sampler(targets, seed=0))) == len(targets)
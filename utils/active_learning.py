@@ -0,0 +1,233 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config import POOL_BATCH_SIZE, UNCERTAINTY_METHOD, LABELING_QUEUE_SIZE
+from utils.locks import FileLock
+from utils.model_store import model_fingerprint
+
+# Unlabeled images go in projects/<name>/pool/. Scoring writes to
+# projects/<name>/active_learning/:
+#   scores.jsonl  one line per scored image, appended batch by batch
+#   queue.json    the LABELING_QUEUE_SIZE most uncertain images still in the pool
+#
+# A line is reused on the next run while the image's size and mtime and the
+# model fingerprint are unchanged, so only new or modified images are scored.
+# Lines for the same path are superseded by later ones.
+#
+# Only one scorer runs per project: it holds scoring.lock, and a request to
+# score while it runs leaves a rescore file (holding the requested method)
+# that the running scorer picks up for another pass. score.log collects the
+# output of scorers started in the background.
+UNCERTAINTY_METHODS = ('entropy', 'margin')
+
+def pool_dir(project_dir):
+    return os.path.join(project_dir, 'pool')
+
+def _state_dir(project_dir):
+    return os.path.join(project_dir, 'active_learning')
+
+def scoring_lock(project_dir):
+    return FileLock(os.path.join(_state_dir(project_dir), 'scoring.lock'))
+
+def score_log_path(project_dir):
+    return os.path.join(_state_dir(project_dir), 'score.log')
+
+def request_rescore(project_dir, method=None):
+    """Ask the project's scorer for a (further) pass over the pool"""
+    os.makedirs(_state_dir(project_dir), exist_ok=True)
+    with open(os.path.join(_state_dir(project_dir), 'rescore'), 'w') as f:
+        f.write(method or '')
+
+def rescore_requested(project_dir):
+    return os.path.exists(os.path.join(_state_dir(project_dir), 'rescore'))
+
+def take_rescore(project_dir):
+    """
+    Clear a pending rescore request.
+
+    Returns:
+        None if no pass was requested, otherwise the requested uncertainty
+        method ('' for the default)
+    """
+    rescore_path = os.path.join(_state_dir(project_dir), 'rescore')
+    # Renamed first so a request written meanwhile is kept for the next pass
+    try:
+        os.replace(rescore_path, rescore_path + '.taken')
+    except FileNotFoundError:
+        return None
+    with open(rescore_path + '.taken', 'r') as f:
+        method = f.read().strip()
+    os.remove(rescore_path + '.taken')
+    return method
+
+def uncertainty(probabilities, method=UNCERTAINTY_METHOD):
+    """
+    Uncertainty of softmax outputs; higher means more worth labeling.
+
+    Args:
+        probabilities: Array of shape (N, classes)
+        method: 'entropy' (of the whole distribution) or 'margin' (one minus
+            the gap between the two most likely classes)
+
+    Returns:
+        Array of shape (N,)
+    """
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    if method == 'entropy':
+        return -(probabilities * np.log(np.clip(probabilities, 1e-12, None))).sum(axis=1)
+    if method == 'margin':
+        if probabilities.shape[1] < 2:
+            return np.zeros(len(probabilities))
+        top2 = np.sort(probabilities, axis=1)[:, -2:]
+        return 1 - (top2[:, 1] - top2[:, 0])
+    raise ValueError(f"Unknown uncertainty method: {method}")
+
+def _pool_files(project_dir):
+    """(relative path, size, mtime_ns) of every image in the pool"""
+    from utils.archive import IMAGE_EXTENSIONS
+
+    root_dir = pool_dir(project_dir)
+    files = []
+    for root, dirs, names in os.walk(root_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(names):
+            if name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith('.'):
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                files.append((Path(os.path.relpath(path, root_dir)).as_posix(),
+                              stat.st_size, stat.st_mtime_ns))
+    return files
+
+def _read_scores(project_dir):
+    """Latest score line of every path"""
+    scores = {}
+    scores_path = os.path.join(_state_dir(project_dir), 'scores.jsonl')
+    if os.path.exists(scores_path):
+        with open(scores_path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by an interrupted run
+                    continue
+                scores[entry['path']] = entry
+    return scores
+
+def score_pool(project_dir, model_path, class_labels, method=UNCERTAINTY_METHOD,
+               batch_size=POOL_BATCH_SIZE, progress=None):
+    """
+    Score the project's unlabeled pool and rewrite the labeling queue.
+
+    Images already scored with the current model are skipped, and scores are
+    appended after every batch, so an interrupted run resumes where it stopped.
+
+    Args:
+        project_dir: Project directory
+        model_path: Weights used for scoring
+        class_labels: Class names of the model
+        method: Uncertainty used to rank the queue
+        batch_size: Images per forward pass
+        progress: Optional callable(scored, total) invoked after each batch
+
+    Returns:
+        tuple: (number of images scored in this run, queue dict)
+    """
+    from PIL import Image
+    from utils.predictor import predict_batch
+
+    state_dir = _state_dir(project_dir)
+    os.makedirs(state_dir, exist_ok=True)
+    scores_path = os.path.join(state_dir, 'scores.jsonl')
+
+    fingerprint = model_fingerprint(model_path)
+    scores = _read_scores(project_dir)
+    if any(entry['model'] != fingerprint for entry in scores.values()):
+        # Scores of a previous model are stale; start a fresh file
+        scores = {}
+        open(scores_path, 'w').close()
+
+    files = _pool_files(project_dir)
+    pending = [(rel_path, size, mtime) for rel_path, size, mtime in files
+               if (rel_path not in scores or scores[rel_path]['size'] != size
+                   or scores[rel_path]['mtime_ns'] != mtime)]
+
+    root_dir = pool_dir(project_dir)
+    for start in range(0, len(pending), batch_size):
+        batch, images, entries = pending[start:start + batch_size], [], []
+        for rel_path, size, mtime in batch:
+            entry = {'path': rel_path, 'size': size, 'mtime_ns': mtime, 'model': fingerprint}
+            try:
+                with Image.open(os.path.join(root_dir, rel_path)) as img:
+                    images.append(img.convert('RGB'))
+            except Exception as e:
+                # Recorded so unreadable files are not retried on every run
+                entry['error'] = str(e)
+                images.append(None)
+            entries.append(entry)
+
+        readable = [img for img in images if img is not None]
+        if readable:
+            probabilities = iter(predict_batch(readable, model_path, len(class_labels)))
+            for entry, img in zip(entries, images):
+                if img is None:
+                    continue
+                probs = next(probabilities)
+                top = int(probs.argmax())
+                entry['prediction'] = class_labels[top]
+                entry['confidence'] = float(probs[top])
+                for name in UNCERTAINTY_METHODS:
+                    entry[name] = float(uncertainty(probs[None], name)[0])
+
+        with open(scores_path, 'a') as f:
+            f.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+        for entry in entries:
+            scores[entry['path']] = entry
+        if progress is not None:
+            progress(start + len(batch), len(pending))
+
+    return len(pending), write_queue(project_dir, scores, files, method)
+
+def write_queue(project_dir, scores, files, method=UNCERTAINTY_METHOD, size=LABELING_QUEUE_SIZE):
+    """Rank the scored pool images by uncertainty and write queue.json"""
+    in_pool = {rel_path for rel_path, _, _ in files}
+    ranked = sorted((entry for path, entry in scores.items()
+                     if path in in_pool and 'error' not in entry),
+                    key=lambda entry: -entry[method])
+    queue = {
+        'method': method,
+        'pool_size': len(in_pool),
+        'scored': sum(1 for path in scores if path in in_pool),
+        'items': [{
+            'path': entry['path'],
+            'uncertainty': entry[method],
+            'prediction': entry['prediction'],
+            'confidence': entry['confidence']
+        } for entry in ranked[:size]]
+    }
+    queue_path = os.path.join(_state_dir(project_dir), 'queue.json')
+    with open(queue_path + '.tmp', 'w') as f:
+        json.dump(queue, f, indent=2)
+    os.replace(queue_path + '.tmp', queue_path)
+    return queue
+
+def read_queue(project_dir):
+    """
+    The labeling queue, without images labeled (moved out of the pool) since
+    it was written, or None if the pool has not been scored
+    """
+    queue_path = os.path.join(_state_dir(project_dir), 'queue.json')
+    if not os.path.exists(queue_path):
+        return None
+    with open(queue_path, 'r') as f:
+        queue = json.load(f)
+    root_dir = pool_dir(project_dir)
+    queue['items'] = [item for item in queue['items']
+                      if os.path.exists(os.path.join(root_dir, item['path']))]
+    return queue
@@ -0,0 +1,323 @@
+import json
+import os
+import shutil
+import sys
+import tarfile
+import uuid
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config import ALLOWED_EXTENSIONS, ARCHIVE_SHARD_SIZE, ARCHIVE_EXCLUDE
+
+# A project archive is a directory of uncompressed tar shards plus index.json:
+#   shard-000000.tar  config.json, models/... then the first dataset images
+#   shard-000001.tar  more dataset/<class>/<file> images, in ImageFolder order
+#   index.json        classes, sample counts and the files of every shard
+#
+# Every shard is a complete tar file, so shards can be streamed, copied and
+# read independently, and concatenated shards still read as one tar stream.
+# Derived data (ARCHIVE_EXCLUDE, e.g. the dataset cache and the similarity
+# index, and the model.safetensors copies of the weights) is left out and
+# rebuilt on the importing host, as are sweep trials, whose winning weights
+# are already stored as a model version.
+#
+# Archives are untrusted input: member paths are sanitised, and every
+# model.pth is checked to be a plain state dict of the expected shape before
+# it is moved into place.
+INDEX_NAME = 'index.json'
+# Project metadata that only a new import may take from an archive
+PROJECT_METADATA = ('config.json', os.path.join('models', 'current.json'))
+IMAGE_EXTENSIONS = tuple('.' + ext for ext in ALLOWED_EXTENSIONS if ext != 'zip')
+
+def shard_name(shard):
+    return f"shard-{shard:06d}.tar"
+
+def _project_files(project_dir):
+    """(relative path, size) of the files to archive, project metadata first"""
+    metadata, dataset = [], []
+    for root, dirs, files in os.walk(project_dir):
+        rel_root = os.path.relpath(root, project_dir)
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.')
+                         and not (rel_root == '.' and d in ARCHIVE_EXCLUDE))
+        for name in sorted(files):
+            if name.startswith('.') or name.endswith(('.tmp', '.lock', '.safetensors')):
+                continue
+            rel_path = Path(rel_root, name).as_posix()
+            entry = (rel_path, os.path.getsize(os.path.join(root, name)))
+            (dataset if rel_path.startswith('dataset/') else metadata).append(entry)
+    return metadata + dataset
+
+def sample_class(rel_path):
+    """Class name of a dataset image inside an archive, or None for other files"""
+    parts = rel_path.split('/')
+    if len(parts) >= 3 and parts[0] == 'dataset' and parts[-1].lower().endswith(IMAGE_EXTENSIONS):
+        return parts[1]
+    return None
+
+def plan_archive(project_dir, shard_size=ARCHIVE_SHARD_SIZE):
+    """
+    Split a project's files into shards of about shard_size bytes.
+
+    Returns:
+        Index dict as stored in index.json
+    """
+    shards = []
+    current, current_bytes = [], 0
+    for rel_path, size in _project_files(project_dir):
+        if current and current_bytes + size > shard_size:
+            shards.append(current)
+            current, current_bytes = [], 0
+        current.append([rel_path, size])
+        current_bytes += size
+    if current:
+        shards.append(current)
+
+    classes = sorted({c for files in shards for rel_path, _ in files
+                      for c in [sample_class(rel_path)] if c})
+    return {
+        'format': 1,
+        'project': os.path.basename(os.path.normpath(project_dir)),
+        'classes': classes,
+        'num_samples': sum(1 for files in shards for rel_path, _ in files if sample_class(rel_path)),
+        'shards': [{
+            'name': shard_name(i),
+            'samples': sum(1 for rel_path, _ in files if sample_class(rel_path)),
+            'bytes': sum(size for _, size in files),
+            'files': files
+        } for i, files in enumerate(shards)]
+    }
+
+class _ChunkBuffer:
+    """Write target for a streaming TarFile that hands the bytes back in chunks"""
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def iter_shard(project_dir, files):
+    """
+    Generate the bytes of one tar shard without building it in memory or on disk.
+
+    At most one archived file is buffered at a time.
+
+    Args:
+        project_dir: Project directory
+        files: [relative path, size] pairs from plan_archive()
+
+    Yields:
+        Consecutive chunks of the tar stream
+    """
+    buffer = _ChunkBuffer()
+    tar = tarfile.open(fileobj=buffer, mode='w|', format=tarfile.PAX_FORMAT)
+    try:
+        for rel_path, _ in files:
+            path = os.path.join(project_dir, rel_path)
+            info = tar.gettarinfo(path, arcname=rel_path)
+            info.uid = info.gid = 0
+            info.uname = info.gname = ''
+            with open(path, 'rb') as f:
+                tar.addfile(info, f)
+            yield buffer.drain()
+    finally:
+        tar.close()
+    yield buffer.drain()
+
+def export_project(project_dir, output_dir, shard_size=ARCHIVE_SHARD_SIZE):
+    """
+    Write a project as tar shards plus index.json into output_dir.
+
+    Returns:
+        The index dict
+    """
+    index = plan_archive(project_dir, shard_size)
+    os.makedirs(output_dir, exist_ok=True)
+    for shard in index['shards']:
+        shard_path = os.path.join(output_dir, shard['name'])
+        with open(shard_path + '.tmp', 'wb') as f:
+            for chunk in iter_shard(project_dir, shard['files']):
+                f.write(chunk)
+        os.replace(shard_path + '.tmp', shard_path)
+
+    # Written last, so an index always describes complete shards
+    with open(os.path.join(output_dir, INDEX_NAME), 'w') as f:
+        json.dump(index, f)
+    return index
+
+def read_index(archive_dir):
+    with open(os.path.join(archive_dir, INDEX_NAME), 'r') as f:
+        return json.load(f)
+
+def archive_sources(path):
+    """Shard files of an archive directory in index order, or [path] for a single tar file"""
+    if os.path.isdir(path):
+        return [os.path.join(path, shard['name']) for shard in read_index(path)['shards']]
+    return [path]
+
+def _member_path(member):
+    """Safe relative path of a tar member, or None if it must not be extracted"""
+    parts = Path(member.name).parts
+    if not member.isfile() or not parts or os.path.isabs(member.name) \
+            or any(part in ('', '.', '..') or part.startswith('.') for part in parts):
+        return None
+    return os.path.join(*parts)
+
+def _extract(source, target_dir, skip=()):
+    """
+    Stream the regular files of a tar file or binary stream into target_dir.
+
+    Model weights are left under their .tmp name until _install_weights()
+    has checked them.
+
+    Args:
+        source: Tar file path or binary stream
+        target_dir: Directory to extract into
+        skip: Relative paths of members to leave out
+
+    Returns:
+        Relative paths of the extracted model weights
+    """
+    weights = []
+    # ignore_zeros reads on past the end marker of each concatenated shard
+    if isinstance(source, str):
+        tar = tarfile.open(source, mode='r|', ignore_zeros=True)
+    else:
+        tar = tarfile.open(fileobj=source, mode='r|', ignore_zeros=True)
+    with tar:
+        for member in tar:
+            rel_path = _member_path(member)
+            # .safetensors files are rebuilt from the checked model.pth
+            if rel_path is None or rel_path.endswith('.safetensors') or rel_path in skip:
+                continue
+            path = os.path.join(target_dir, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                shutil.copyfileobj(tar.extractfile(member), f)
+            if rel_path.endswith('.pth'):
+                weights.append(rel_path)
+            else:
+                os.replace(path + '.tmp', path)
+    return weights
+
+def _install_weights(project_dir, weights, num_classes):
+    """
+    Check extracted model weights and move them into place with their
+    memory-mappable copies, or remove them all if any is invalid.
+
+    Raises:
+        ValueError: If a weights file is not a model state dict
+    """
+    if not weights:
+        return
+    from utils.model_store import check_weights, write_mmap_weights
+
+    served = os.path.join('models', 'model.pth')
+    try:
+        for rel_path in weights:
+            check_weights(os.path.join(project_dir, rel_path + '.tmp'),
+                          num_classes if rel_path == served else None)
+    except ValueError as e:
+        for rel_path in weights:
+            os.remove(os.path.join(project_dir, rel_path + '.tmp'))
+        raise ValueError(f"Invalid model weights in archive: {e}")
+
+    for rel_path in weights:
+        path = os.path.join(project_dir, rel_path)
+        os.replace(path + '.tmp', path)
+        write_mmap_weights(path)
+
+def _imported_version(project_dir):
+    """Promoted version named by an imported current.json, or None if its weights were not imported"""
+    from utils.model_store import current_version, is_version, version_model_path
+
+    try:
+        version = current_version(project_dir)
+    except (ValueError, KeyError, TypeError):
+        return None
+    if is_version(project_dir, version) and os.path.exists(version_model_path(project_dir, version)):
+        return version
+    return None
+
+def import_archive(sources, project_dir, append=False):
+    """
+    Extract archive shards into a project.
+
+    A new project is extracted next to its final location and renamed into
+    place, so it only appears once every shard has been read. With append,
+    the shards are added to an existing project instead, e.g. the remaining
+    shards of an archive imported one request at a time; their config.json
+    and current.json are ignored, so an archive cannot change the settings
+    of a live project.
+
+    The serving policy of a new project is reset, and model_version is only
+    kept if it names a version stored in the archive.
+
+    Args:
+        sources: Shard file paths and/or binary streams, in order
+        project_dir: Project directory to create (or extend with append)
+        append: Add to an existing project
+
+    Returns:
+        project_dir
+    """
+    if append:
+        config_path = os.path.join(project_dir, 'config.json')
+        if not os.path.exists(config_path):
+            raise ValueError("Project not found")
+        with open(config_path, 'r') as f:
+            num_classes = len(json.load(f).get('classes', []))
+        for source in sources:
+            _install_weights(project_dir, _extract(source, project_dir, skip=PROJECT_METADATA),
+                             num_classes)
+        return project_dir
+
+    if os.path.exists(project_dir):
+        raise ValueError("Project already exists")
+
+    parent, name = os.path.split(os.path.normpath(project_dir))
+    staging_dir = os.path.join(parent, f".{name}.import-{uuid.uuid4().hex[:8]}")
+    os.makedirs(staging_dir)
+    try:
+        weights = []
+        for source in sources:
+            weights += _extract(source, staging_dir)
+
+        config_path = os.path.join(staging_dir, 'config.json')
+        if not os.path.exists(config_path):
+            raise ValueError("Archive has no config.json; the first shard is missing")
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        _install_weights(staging_dir, weights, len(config.get('classes', [])))
+
+        # The project may be imported under a different name
+        config['name'] = name
+        # Canary/shadow/ensemble versions and model_version are used to build
+        # model paths, so only trust a version that was actually imported
+        config.pop('serving', None)
+        config.pop('model_version', None)
+        version = _imported_version(staging_dir)
+        if version:
+            config['model_version'] = version
+        if os.path.exists(os.path.join(staging_dir, 'models', 'model.pth')):
+            config['model_path'] = os.path.join(project_dir, 'models', 'model.pth')
+        else:
+            config['trained'] = False
+            config['model_path'] = None
+        with open(config_path, 'w') as f:
+            json.dump(config, f, indent=2)
+
+        os.makedirs(os.path.join(staging_dir, 'dataset'), exist_ok=True)
+        os.makedirs(os.path.join(staging_dir, 'models'), exist_ok=True)
+        os.rename(staging_dir, project_dir)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    return project_dir
@@ -0,0 +1,99 @@
+import math
+
+import torch
+import torch.nn.functional as F
+
+# ITU-R 601-2 luma weights, as used by torchvision's rgb_to_grayscale
+_GRAY_WEIGHTS = (0.299, 0.587, 0.114)
+
+def normalize_batch(images):
+    """
+    Convert a batch to the model's input range.
+
+    Args:
+        images: uint8 (N, 3, H, W) tensor, or float in [0, 1]
+
+    Returns:
+        float tensor normalised with mean 0.5 and std 0.5
+    """
+    if images.dtype == torch.uint8:
+        images = images.float().div_(255)
+    return (images - 0.5) / 0.5
+
+def _grayscale(images):
+    r, g, b = images.unbind(1)
+    return (_GRAY_WEIGHTS[0] * r + _GRAY_WEIGHTS[1] * g + _GRAY_WEIGHTS[2] * b).unsqueeze(1)
+
+def _blend(images, other, factors):
+    return (factors * images + (1 - factors) * other).clamp_(0, 1)
+
+class BatchAugmentation:
+    """
+    Random flip, rotation and color jitter applied to a whole batch at once.
+
+    Every image still gets its own random parameters, but they are drawn as
+    tensors and applied with a handful of batched ops (one grid_sample for
+    all rotations), on whatever device the batch lives on. Jitter is applied
+    in a fixed order (brightness, contrast, saturation) rather than
+    torchvision's random order.
+    """
+    def __init__(self, horizontal_flip=False, rotation=0, color_jitter=None):
+        color_jitter = {k: v for k, v in (color_jitter or {}).items() if v}
+        unsupported = set(color_jitter) - {'brightness', 'contrast', 'saturation'}
+        if unsupported:
+            raise ValueError(f"Unsupported color jitter settings: {sorted(unsupported)}")
+        self.horizontal_flip = horizontal_flip
+        self.rotation = rotation
+        self.color_jitter = color_jitter
+
+    @classmethod
+    def from_settings(cls, augmentation):
+        """Build from a dict with horizontal_flip, rotation and color_jitter"""
+        return cls(horizontal_flip=augmentation.get('horizontal_flip', False),
+                   rotation=augmentation.get('rotation', 0),
+                   color_jitter=augmentation.get('color_jitter'))
+
+    @staticmethod
+    def _uniform(n, low, high, device):
+        return low + (high - low) * torch.rand(n, device=device)
+
+    def __call__(self, images):
+        """
+        Args:
+            images: uint8 (N, 3, H, W) tensor, or float in [0, 1]
+
+        Returns:
+            Augmented float batch, normalised like normalize_batch()
+        """
+        if images.dtype == torch.uint8:
+            images = images.float().div_(255)
+        n, device = images.size(0), images.device
+
+        if self.horizontal_flip:
+            flip = self._uniform(n, 0, 1, device) < 0.5
+            images = torch.where(flip.view(-1, 1, 1, 1), images.flip(-1), images)
+
+        if self.rotation:
+            angles = self._uniform(n, -self.rotation, self.rotation, device) * (math.pi / 180)
+            cos, sin = angles.cos(), angles.sin()
+            zeros = torch.zeros_like(cos)
+            theta = torch.stack([torch.stack([cos, -sin, zeros], 1),
+                                 torch.stack([sin, cos, zeros], 1)], 1)
+            grid = F.affine_grid(theta, images.shape, align_corners=False)
+            # Corners rotated in from outside the image are filled with black
+            images = F.grid_sample(images, grid, mode='bilinear', padding_mode='zeros',
+                                   align_corners=False)
+
+        if self.color_jitter:
+            def factors(strength):
+                return self._uniform(n, max(0.0, 1 - strength), 1 + strength, device).view(-1, 1, 1, 1)
+
+            if 'brightness' in self.color_jitter:
+                images = _blend(images, 0.0, factors(self.color_jitter['brightness']))
+            if 'contrast' in self.color_jitter:
+                mean = _grayscale(images).mean(dim=(1, 2, 3), keepdim=True)
+                images = _blend(images, mean, factors(self.color_jitter['contrast']))
+            if 'saturation' in self.color_jitter:
+                images = _blend(images, _grayscale(images), factors(self.color_jitter['saturation']))
+
+        return normalize_batch(images)
@@ -0,0 +1,201 @@
+import hashlib
+import io
+import json
+import os
+import random
+import tarfile
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset, IterableDataset
+
+IMG_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+def scan_dataset(dataset_dir):
+    """
+    List the images of an ImageFolder-style dataset.
+
+    Returns:
+        tuple: (sorted class names, list of (path, class_index) in ImageFolder order)
+    """
+    classes = sorted(d for d in os.listdir(dataset_dir)
+                     if os.path.isdir(os.path.join(dataset_dir, d)) and not d.startswith('.'))
+    samples = []
+    for class_index, class_name in enumerate(classes):
+        class_dir = os.path.join(dataset_dir, class_name)
+        for root, _, files in sorted(os.walk(class_dir)):
+            for fname in sorted(files):
+                if fname.lower().endswith(IMG_EXTENSIONS):
+                    samples.append((os.path.join(root, fname), class_index))
+    return classes, samples
+
+def _signature(samples, image_size):
+    """Fingerprint of the dataset contents, used to detect a stale cache"""
+    digest = hashlib.sha1(repr(tuple(image_size)).encode())
+    for path, class_index in samples:
+        stat = os.stat(path)
+        digest.update(f"{path}|{class_index}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+def build_dataset_cache(dataset_dir, cache_dir, image_size=(128, 128)):
+    """
+    Decode and resize every image of an ImageFolder dataset once.
+
+    The images are stored as a single uint8 array of shape (N, H, W, 3) that
+    later readers memory-map, so concurrent training processes share the
+    same pages instead of each decoding the dataset again. An existing
+    cache is reused when the dataset has not changed.
+
+    Args:
+        dataset_dir: ImageFolder-style dataset directory
+        cache_dir: Directory to write the cache into
+        image_size: (height, width) the images are resized to
+
+    Returns:
+        Path to the cache directory
+    """
+    classes, samples = scan_dataset(dataset_dir)
+    signature = _signature(samples, image_size)
+    meta_path = os.path.join(cache_dir, 'meta.json')
+
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r') as f:
+            if json.load(f).get('signature') == signature:
+                return cache_dir
+
+    os.makedirs(cache_dir, exist_ok=True)
+    height, width = image_size
+    images_tmp = os.path.join(cache_dir, 'images.tmp.npy')
+    images = np.lib.format.open_memmap(images_tmp, mode='w+', dtype=np.uint8,
+                                       shape=(len(samples), height, width, 3))
+    for i, (path, _) in enumerate(samples):
+        with Image.open(path) as img:
+            images[i] = np.asarray(img.convert('RGB').resize((width, height), Image.BILINEAR))
+    images.flush()
+    del images
+
+    labels = np.array([class_index for _, class_index in samples], dtype=np.int64)
+    np.save(os.path.join(cache_dir, 'labels.npy'), labels)
+    os.replace(images_tmp, os.path.join(cache_dir, 'images.npy'))
+
+    with open(meta_path, 'w') as f:
+        json.dump({
+            'signature': signature,
+            'classes': classes,
+            'image_size': list(image_size),
+            'num_images': len(samples)
+        }, f, indent=2)
+
+    return cache_dir
+
+def load_dataset_cache(cache_dir):
+    """
+    Open a cache written by build_dataset_cache.
+
+    Returns:
+        tuple: (images memmap, labels array, class names)
+    """
+    with open(os.path.join(cache_dir, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    images = np.load(os.path.join(cache_dir, 'images.npy'), mmap_mode='r')
+    labels = np.load(os.path.join(cache_dir, 'labels.npy'))
+    return images, labels, meta['classes']
+
+class CachedImageDataset(Dataset):
+    """
+    Dataset over a memory-mapped image cache.
+
+    Items are uint8 CHW tensors passed through `transform`, so tensor
+    transforms (flip, rotation, color jitter, normalize) apply directly.
+    """
+    def __init__(self, images, labels, indices=None, transform=None):
+        self.images = images
+        self.labels = labels
+        self.indices = np.arange(len(labels)) if indices is None else np.asarray(indices)
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, idx):
+        i = self.indices[idx]
+        image = torch.from_numpy(np.array(self.images[i])).permute(2, 0, 1)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, int(self.labels[i])
+
+class ShardDataset(IterableDataset):
+    """
+    Dataset streaming the images of a project archive (see utils.archive).
+
+    Shards are read front to back with sequential I/O, in an order shuffled
+    per epoch, and images are shuffled within a buffer of shuffle_buffer
+    items. Under data-parallel training every process reads the shards in
+    the same order and keeps every world_size-th image, truncated so all
+    processes run the same number of batches.
+    """
+    def __init__(self, archive_dir, transform=None, rank=0, world_size=1,
+                 shuffle_buffer=1000, seed=0):
+        from utils.archive import read_index
+
+        index = read_index(archive_dir)
+        self.classes = index['classes']
+        self.class_to_idx = {name: i for i, name in enumerate(self.classes)}
+        self.shards = [os.path.join(archive_dir, shard['name'])
+                       for shard in index['shards'] if shard['samples']]
+        self.num_samples = index['num_samples'] // world_size
+        self.transform = transform
+        self.rank = rank
+        self.world_size = world_size
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return self.num_samples
+
+    def _samples(self):
+        """(encoded image bytes, class index) of this process's images"""
+        from utils.archive import sample_class
+
+        shards = list(self.shards)
+        random.Random(self.seed + self.epoch).shuffle(shards)
+        position = 0
+        for shard_path in shards:
+            with tarfile.open(shard_path, mode='r|') as tar:
+                for member in tar:
+                    class_name = sample_class(member.name) if member.isfile() else None
+                    if class_name not in self.class_to_idx:
+                        continue
+                    if position % self.world_size == self.rank:
+                        yield tar.extractfile(member).read(), self.class_to_idx[class_name]
+                    position += 1
+
+    def _decode(self, data, label):
+        with Image.open(io.BytesIO(data)) as img:
+            image = img.convert('RGB')
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, label
+
+    def __iter__(self):
+        rng = random.Random((self.seed + self.epoch) * self.world_size + self.rank)
+        buffer = []
+        emitted = 0
+        for sample in self._samples():
+            if emitted >= self.num_samples:
+                return
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(sample)
+                continue
+            i = rng.randrange(len(buffer))
+            buffer[i], sample = sample, buffer[i]
+            yield self._decode(*sample)
+            emitted += 1
+        rng.shuffle(buffer)
+        for sample in buffer[:self.num_samples - emitted]:
+            yield self._decode(*sample)
@@ -0,0 +1,254 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config import (EMBEDDING_BATCH_SIZE, INDEX_APPROXIMATE_MIN_IMAGES, INDEX_NPROBE)
+from utils.dataset_cache import scan_dataset
+from utils.locks import FileLock
+from utils.model_store import model_fingerprint
+
+# Index layout inside projects/<name>/index/:
+#   embeddings.f16  raw float16 matrix, one L2-normalised fc2 embedding per row
+#   meta.json       row count, dimension, model fingerprint, image paths and labels
+#   ivf.npz         optional coarse quantizer (centroids + row assignments)
+#   index.lock      held while writing, so builds and updates from app.py
+#                   threads and scripts/build_index.py never interleave
+EMBEDDING_DIM = 128
+QUERY_BLOCK_ROWS = 65536
+
+def _index_lock(index_dir):
+    return FileLock(os.path.join(index_dir, 'index.lock'))
+
+def _read_meta(index_dir):
+    meta_path = os.path.join(index_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r') as f:
+        return json.load(f)
+
+def _write_meta(index_dir, meta):
+    # Readers size their memmap from meta.json, so it is replaced atomically
+    # and only after the rows it describes are on disk
+    tmp_path = os.path.join(index_dir, 'meta.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(index_dir, 'meta.json'))
+
+def _open_matrix(index_dir, count):
+    if count == 0:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float16)
+    return np.memmap(os.path.join(index_dir, 'embeddings.f16'), dtype=np.float16,
+                     mode='r', shape=(count, EMBEDDING_DIM))
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def extract_embeddings(model, image_paths, batch_size=EMBEDDING_BATCH_SIZE):
+    """
+    Compute L2-normalised fc2 embeddings for image files in batches.
+
+    Yields:
+        float32 arrays of shape (batch, EMBEDDING_DIM)
+    """
+    import torch
+    from PIL import Image
+    from utils.predictor import _get_transform
+
+    transform = _get_transform()
+    device = next(model.parameters()).device
+
+    for start in range(0, len(image_paths), batch_size):
+        batch = []
+        for path in image_paths[start:start + batch_size]:
+            with Image.open(path) as img:
+                batch.append(transform(img.convert('RGB')))
+        with torch.no_grad():
+            embeddings = model.embed(torch.stack(batch).to(device))
+        yield _normalize(embeddings.cpu().numpy().astype(np.float32))
+
+def _kmeans(data, num_clusters, iterations=10, seed=0):
+    """Spherical k-means on L2-normalised rows"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), num_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(data @ centroids.T, axis=1)
+        for c in range(num_clusters):
+            members = data[assignments == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+def _assign(matrix, centroids):
+    assignments = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), QUERY_BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + QUERY_BLOCK_ROWS], dtype=np.float32)
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+def _build_ivf(index_dir, matrix):
+    """Cluster the index into ~sqrt(N) lists for approximate search"""
+    num_clusters = max(1, int(np.sqrt(len(matrix))))
+    rng = np.random.default_rng(0)
+    sample_idx = np.sort(rng.choice(len(matrix), min(len(matrix), 100 * num_clusters), replace=False))
+    centroids = _kmeans(np.asarray(matrix[sample_idx], dtype=np.float32), num_clusters)
+    np.savez(os.path.join(index_dir, 'ivf.tmp.npz'), centroids=centroids,
+             assignments=_assign(matrix, centroids))
+    os.replace(os.path.join(index_dir, 'ivf.tmp.npz'), os.path.join(index_dir, 'ivf.npz'))
+
+def build_index(project_dir, model, model_path, approximate=None):
+    """
+    Embed every image in a project's dataset and write the index from scratch.
+
+    Args:
+        project_dir: Project directory
+        model: Loaded ImageClassifier in evaluation mode
+        model_path: Path of the model weights, recorded so a retrain is detected
+        approximate: Build the IVF index; defaults to True when the dataset
+            has at least INDEX_APPROXIMATE_MIN_IMAGES images
+
+    Returns:
+        Number of indexed images
+    """
+    index_dir = os.path.join(project_dir, 'index')
+    dataset_dir = os.path.join(project_dir, 'dataset')
+    classes, samples = scan_dataset(dataset_dir)
+    paths = [os.path.relpath(path, dataset_dir) for path, _ in samples]
+
+    with _index_lock(index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        tmp_path = os.path.join(index_dir, 'embeddings.f16.tmp')
+        with open(tmp_path, 'wb') as f:
+            for embeddings in extract_embeddings(model, [path for path, _ in samples]):
+                f.write(embeddings.astype(np.float16).tobytes())
+        os.replace(tmp_path, os.path.join(index_dir, 'embeddings.f16'))
+
+        ivf_path = os.path.join(index_dir, 'ivf.npz')
+        if approximate is None:
+            approximate = len(samples) >= INDEX_APPROXIMATE_MIN_IMAGES
+        if approximate and samples:
+            _build_ivf(index_dir, _open_matrix(index_dir, len(samples)))
+        elif os.path.exists(ivf_path):
+            os.remove(ivf_path)
+
+        _write_meta(index_dir, {
+            'count': len(samples),
+            'dim': EMBEDDING_DIM,
+            'model': model_fingerprint(model_path),
+            'classes': classes,
+            'paths': paths,
+            'labels': [classes[class_index] for _, class_index in samples]
+        })
+
+    return len(samples)
+
+def update_index(project_dir, model, model_path):
+    """
+    Append embeddings for dataset images that are not indexed yet.
+
+    Falls back to a full build when there is no index or the model changed
+    since the index was built.
+
+    Returns:
+        Number of images added
+    """
+    index_dir = os.path.join(project_dir, 'index')
+    meta = _read_meta(index_dir)
+    if meta is None or meta['model'] != model_fingerprint(model_path):
+        return build_index(project_dir, model, model_path)
+
+    dataset_dir = os.path.join(project_dir, 'dataset')
+    classes, samples = scan_dataset(dataset_dir)
+
+    with _index_lock(index_dir):
+        meta = _read_meta(index_dir)
+        indexed = set(meta['paths'])
+        new_samples = [(path, classes[class_index]) for path, class_index in samples
+                       if os.path.relpath(path, dataset_dir) not in indexed]
+        if not new_samples:
+            return 0
+
+        ivf_path = os.path.join(index_dir, 'ivf.npz')
+        ivf = dict(np.load(ivf_path)) if os.path.exists(ivf_path) else None
+        new_assignments = []
+
+        with open(os.path.join(index_dir, 'embeddings.f16'), 'ab') as f:
+            for embeddings in extract_embeddings(model, [path for path, _ in new_samples]):
+                f.write(embeddings.astype(np.float16).tobytes())
+                if ivf is not None:
+                    new_assignments.append(np.argmax(embeddings @ ivf['centroids'].T, axis=1))
+
+        if ivf is not None:
+            assignments = np.concatenate([ivf['assignments']] + new_assignments).astype(np.int32)
+            np.savez(os.path.join(index_dir, 'ivf.tmp.npz'), centroids=ivf['centroids'],
+                     assignments=assignments)
+            os.replace(os.path.join(index_dir, 'ivf.tmp.npz'), ivf_path)
+
+        meta['count'] += len(new_samples)
+        meta['classes'] = classes
+        meta['paths'] += [os.path.relpath(path, dataset_dir) for path, _ in new_samples]
+        meta['labels'] += [label for _, label in new_samples]
+        _write_meta(index_dir, meta)
+
+    return len(new_samples)
+
+def _top_k(matrix, rows, query, k):
+    """Exact top-k by cosine similarity over the given rows, scanned in blocks"""
+    best_scores = np.empty(0, dtype=np.float32)
+    best_rows = np.empty(0, dtype=np.int64)
+    for start in range(0, len(rows), QUERY_BLOCK_ROWS):
+        block_rows = rows[start:start + QUERY_BLOCK_ROWS]
+        scores = np.asarray(matrix[block_rows], dtype=np.float32) @ query
+        best_scores = np.concatenate([best_scores, scores])
+        best_rows = np.concatenate([best_rows, block_rows])
+        if len(best_scores) > k:
+            keep = np.argpartition(-best_scores, k)[:k]
+            best_scores, best_rows = best_scores[keep], best_rows[keep]
+    order = np.argsort(-best_scores)
+    return best_rows[order], best_scores[order]
+
+def query_index(project_dir, embedding, k=5, nprobe=INDEX_NPROBE):
+    """
+    Find the k indexed images most similar to a query embedding.
+
+    Uses the IVF index when present, searching the nprobe closest lists;
+    otherwise scans every row.
+
+    Args:
+        project_dir: Project directory
+        embedding: Query embedding
+        k: Number of results, at most the number of indexed images
+        nprobe: IVF lists searched
+
+    Returns:
+        List of dicts with path (relative to the dataset), label and score
+    """
+    index_dir = os.path.join(project_dir, 'index')
+    meta = _read_meta(index_dir)
+    if meta is None or meta['count'] == 0:
+        return []
+    k = max(1, min(int(k), meta['count']))
+
+    query = _normalize(np.asarray(embedding, dtype=np.float32).reshape(1, -1))[0]
+    matrix = _open_matrix(index_dir, meta['count'])
+
+    ivf_path = os.path.join(index_dir, 'ivf.npz')
+    rows = np.arange(meta['count'])
+    if os.path.exists(ivf_path):
+        ivf = np.load(ivf_path)
+        assignments = ivf['assignments'][:meta['count']]
+        probe = np.argsort(-(ivf['centroids'] @ query))[:nprobe]
+        # Rows appended after the assignments were saved are always scanned
+        rows = np.concatenate([np.flatnonzero(np.isin(assignments, probe)),
+                               np.arange(len(assignments), meta['count'])])
+
+    top_rows, top_scores = _top_k(matrix, rows, query, k)
+    return [{'path': meta['paths'][row], 'label': meta['labels'][row], 'score': float(score)}
+            for row, score in zip(top_rows, top_scores)]
@@ -0,0 +1,71 @@
+import os
+import time
+
+class FileLock:
+    """
+    Exclusive lock between processes, held on a lock file.
+
+    Uses flock on POSIX and msvcrt.locking on Windows. The operating system
+    drops the lock when the holder exits, so a crashed process never leaves
+    a stale lock behind. Each FileLock object opens its own handle, so two
+    objects for the same path also exclude each other within one process.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def acquire(self, blocking=True):
+        """
+        Take the lock.
+
+        Args:
+            blocking: Wait for the current holder instead of giving up
+
+        Returns:
+            True if the lock was taken, False if it is held elsewhere and
+            blocking is False
+        """
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                # LK_LOCK gives up after 10 seconds, so poll instead
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            raise
+                        time.sleep(0.1)
+            else:
+                import fcntl
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            os.close(fd)
+            if blocking:
+                raise
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        if os.name == 'nt':
+            import msvcrt
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
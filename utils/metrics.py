@@ -0,0 +1,192 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms are kept in a module-level registry and
+rendered by the /metrics endpoint. Everything is guarded by a lock so the
+threaded Flask server can record from several requests at once.
+"""
+
+import bisect
+import cProfile
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Bucket upper bounds in seconds, from sub-millisecond stages to slow model loads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_lock = threading.Lock()
+_registry = []
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        with _lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """Value that can go up and down, e.g. requests in flight"""
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with _lock:
+            self._values[self._key(labels)] = value
+
+    @contextmanager
+    def track(self, **labels):
+        """Increment for the duration of a block"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            state['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            state['sum'] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of a block, in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            items = sorted((key, list(s['counts']), s['sum']) for key, s in self._values.items())
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                labels = _format_labels(self.labelnames, key, [('le', le)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+def render_metrics():
+    """All registered metrics in Prometheus text exposition format"""
+    with _lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+# Prediction hot path
+PREDICT_STAGE_SECONDS = Histogram(
+    'predict_stage_seconds', 'Time spent in each stage of a prediction request',
+    ('stage', 'project', 'backend'))
+PREDICT_REQUESTS = Counter(
+    'predict_requests_total', 'Prediction requests received', ('project',))
+PREDICT_ERRORS = Counter(
+    'predict_errors_total', 'Prediction requests that failed', ('project', 'reason'))
+PREDICT_IN_FLIGHT = Gauge(
+    'predict_in_flight', 'Prediction requests currently being processed')
+MODEL_CACHE_HITS = Counter(
+    'model_cache_hits_total', 'Model loads served from the in-memory cache', ('backend',))
+MODEL_CACHE_MISSES = Counter(
+    'model_cache_misses_total', 'Model loads that read weights from disk', ('backend',))
+
+# Model versions (canary, shadow and ensemble serving)
+MODEL_VERSION_LATENCY_SECONDS = Histogram(
+    'model_version_latency_seconds', 'Prediction latency per model version',
+    ('project', 'version', 'role'))
+MODEL_VERSION_PREDICTIONS = Counter(
+    'model_version_predictions_total', 'Predictions made per model version',
+    ('project', 'version', 'role'))
+MODEL_VERSION_AGREEMENT = Counter(
+    'model_version_agreement_total',
+    'Predictions of a version compared with the served answer, by whether the top class agreed',
+    ('project', 'version', 'agree'))
+
+class RequestProfiler:
+    """
+    Profile a random sample of requests with cProfile.
+
+    Each sampled request writes a .prof file to output_dir, readable with
+    `python -m pstats` or snakeviz. A sample_rate of 0 disables profiling.
+    """
+    def __init__(self, sample_rate=0.0, output_dir='profiles'):
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+
+    def start(self):
+        """Return a running profiler if this request is sampled, else None"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            return None
+        return profiler
+
+    def stop(self, profiler, name):
+        """Stop a profiler returned by start() and write its stats"""
+        profiler.disable()
+        os.makedirs(self.output_dir, exist_ok=True)
+        filename = f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}.prof"
+        profiler.dump_stats(os.path.join(self.output_dir, filename))
@@ -0,0 +1,245 @@
+import json
+import os
+import shutil
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from utils.locks import FileLock
+
+# Versioned model artifacts inside projects/<name>/models/:
+#   versions/<version>/model.pth    immutable weights of every trained version
+#   versions/<version>/model.safetensors  the same weights in a memory-mappable layout
+#   versions/<version>/meta.json    classes, training params and creation time
+#   model.pth                       copy of the promoted version's weights, for tools
+#                                   that load a project's model directly
+#   model.safetensors               memory-mappable copy of model.pth
+#   current.json                    id of the promoted version
+#   promote.lock                    held while promoting or rewriting config.json
+#
+# Serving loads versions/<model_version>/ as named by the project's
+# config.json, which also holds the version's classes, so replacing
+# config.json is the switch between versions: a reader sees either the old
+# classes and weights or the new ones. Versions are written to a temporary
+# directory and renamed into place, and every other file is replaced with
+# os.replace, so a reader never sees a partially written file. Replacing
+# (rather than overwriting) also keeps the old inode alive for workers that
+# still have model.safetensors mapped. Everything that reads, modifies and
+# writes config.json does so under config_lock(), so concurrent promotions
+# and config updates from app.py and the training scripts never lose writes.
+
+def _models_dir(project_dir):
+    return os.path.join(project_dir, 'models')
+
+def _versions_dir(project_dir):
+    return os.path.join(_models_dir(project_dir), 'versions')
+
+def _tmp_path(path):
+    """Unique temporary name next to path, since several processes may write it"""
+    return f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+
+def _replace_with_copy(source, path):
+    tmp_path = _tmp_path(path)
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, path)
+
+def config_lock(project_dir):
+    """Lock to hold while reading, modifying and writing a project's config.json"""
+    return FileLock(os.path.join(_models_dir(project_dir), 'promote.lock'))
+
+def write_config(project_dir, config):
+    """Replace a project's config.json atomically; call with config_lock() held"""
+    config_path = os.path.join(project_dir, 'config.json')
+    tmp_path = _tmp_path(config_path)
+    with open(tmp_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, config_path)
+
+def model_fingerprint(model_path):
+    """Changes whenever the weights file is replaced, e.g. by retraining or promotion"""
+    stat = os.stat(model_path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+def new_version_id():
+    """Sortable, unique version id"""
+    return f"v{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+def write_mmap_weights(weights_path):
+    """Write the memory-mappable .safetensors copy next to a model.pth"""
+    import torch
+    from models.model import save_mmap_weights
+
+    mmap_path = os.path.splitext(weights_path)[0] + '.safetensors'
+    save_mmap_weights(torch.load(weights_path, map_location='cpu', weights_only=True), mmap_path)
+    return mmap_path
+
+def check_weights(weights_path, num_classes=None):
+    """
+    Check that a model.pth from an untrusted source holds an ImageClassifier
+    state dict, without unpickling arbitrary objects.
+
+    Args:
+        weights_path: Weights file
+        num_classes: Expected number of outputs, or None to accept any
+
+    Raises:
+        ValueError: If the file is not a state dict of the expected shape
+    """
+    import torch
+    from models.model import ImageClassifier
+
+    try:
+        state_dict = torch.load(weights_path, map_location='cpu', weights_only=True)
+    except Exception as e:
+        raise ValueError(f"Unreadable model weights: {e}")
+    if not isinstance(state_dict, dict) or not isinstance(state_dict.get('fc3.bias'), torch.Tensor):
+        raise ValueError("Model weights are not an ImageClassifier state dict")
+
+    outputs = state_dict['fc3.bias'].numel()
+    if num_classes is not None and outputs != num_classes:
+        raise ValueError(f"Model weights have {outputs} outputs but the project has {num_classes} classes")
+    expected = ImageClassifier(num_classes=outputs).state_dict()
+    if set(state_dict) != set(expected) or any(
+            not isinstance(state_dict[name], torch.Tensor) or state_dict[name].shape != tensor.shape
+            for name, tensor in expected.items()):
+        raise ValueError("Model weights do not match the ImageClassifier architecture")
+
+def save_version(project_dir, weights_path, classes, info=None):
+    """
+    Store a trained model as a new immutable version.
+
+    Args:
+        project_dir: Project directory
+        weights_path: File holding the state dict (copied, left in place)
+        classes: Class labels the model was trained on
+        info: Extra metadata, e.g. training params
+
+    Returns:
+        Version id
+    """
+    version = new_version_id()
+    tmp_dir = os.path.join(_versions_dir(project_dir), f".{version}.tmp")
+    os.makedirs(tmp_dir)
+    shutil.copyfile(weights_path, os.path.join(tmp_dir, 'model.pth'))
+    write_mmap_weights(os.path.join(tmp_dir, 'model.pth'))
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump({
+            'version': version,
+            'created_at': datetime.now().isoformat(),
+            'classes': classes,
+            **(info or {})
+        }, f, indent=2)
+    os.rename(tmp_dir, os.path.join(_versions_dir(project_dir), version))
+    return version
+
+def promote(project_dir, version, config_updates=None):
+    """
+    Atomically make a stored version the one served by default.
+
+    The copies of the weights and current.json are replaced first; the
+    single replace of config.json with the version's id, classes and
+    config_updates then switches serving over. A canary or shadow candidate
+    that gets promoted stops being compared with itself.
+
+    Returns:
+        Path of the promoted version's model.pth copy
+
+    Raises:
+        ValueError: If version is not a stored version of the project
+    """
+    with config_lock(project_dir):
+        if not is_version(project_dir, version):
+            raise ValueError(f"Unknown model version: {version}")
+        source = version_model_path(project_dir, version)
+
+        model_path = os.path.join(_models_dir(project_dir), 'model.pth')
+        _replace_with_copy(source, model_path)
+
+        mmap_source = os.path.splitext(source)[0] + '.safetensors'
+        mmap_path = os.path.splitext(model_path)[0] + '.safetensors'
+        if os.path.exists(mmap_source):
+            _replace_with_copy(mmap_source, mmap_path)
+        elif os.path.exists(mmap_path):
+            # Versions stored before memory-mapped weights have no copy; drop the
+            # stale one so loading falls back to model.pth
+            os.remove(mmap_path)
+
+        current_path = os.path.join(_models_dir(project_dir), 'current.json')
+        tmp_path = _tmp_path(current_path)
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': version, 'promoted_at': datetime.now().isoformat()}, f)
+        os.replace(tmp_path, current_path)
+
+        with open(os.path.join(project_dir, 'config.json'), 'r') as f:
+            config = json.load(f)
+        classes = version_classes(project_dir, version)
+        config.update({
+            'trained': True,
+            'model_path': model_path,
+            'model_version': version,
+            'classes': classes,
+            'num_classes': len(classes),
+            **(config_updates or {})
+        })
+        if (config.get('serving') or {}).get('candidate') == version:
+            config['serving'] = {'mode': 'off'}
+        write_config(project_dir, config)
+    return model_path
+
+def served_model_path(project_dir, config):
+    """
+    Weights served for a project: the version config.json names, or
+    models/model.pth for models trained before versioning.
+    """
+    version = config.get('model_version')
+    if version:
+        return version_model_path(project_dir, version)
+    return os.path.join(_models_dir(project_dir), 'model.pth')
+
+def current_version(project_dir):
+    """Id of the promoted version, or None for models trained before versioning"""
+    current_path = os.path.join(_models_dir(project_dir), 'current.json')
+    if not os.path.exists(current_path):
+        return None
+    with open(current_path, 'r') as f:
+        return json.load(f)['version']
+
+def version_model_path(project_dir, version):
+    """Weights of a stored version"""
+    if not isinstance(version, str) or os.path.basename(version) != version or version.startswith('.'):
+        raise ValueError(f"Invalid model version: {version!r}")
+    return os.path.join(_versions_dir(project_dir), version, 'model.pth')
+
+def version_classes(project_dir, version):
+    """Class labels a stored version was trained on"""
+    with open(os.path.join(_versions_dir(project_dir), version, 'meta.json'), 'r') as f:
+        return json.load(f)['classes']
+
+def is_version(project_dir, version):
+    """Whether version names a stored version; checked before building paths from client input"""
+    return isinstance(version, str) and version in {meta['version'] for meta in list_versions(project_dir)}
+
+def list_versions(project_dir):
+    """Metadata of every stored version, oldest first"""
+    versions_dir = _versions_dir(project_dir)
+    if not os.path.exists(versions_dir):
+        return []
+    versions = []
+    for version in sorted(os.listdir(versions_dir)):
+        meta_path = os.path.join(versions_dir, version, 'meta.json')
+        if not version.startswith('.') and os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            # Version ids are used in paths, so the id must be the directory name
+            if isinstance(meta, dict) and meta.get('version') == version:
+                versions.append(meta)
+    return versions
+
+def save_and_promote(project_dir, weights_path, classes, info=None, config_updates=None):
+    """Store weights as a new version and promote it; returns (version, model_path)"""
+    version = save_version(project_dir, weights_path, classes, info)
+    return version, promote(project_dir, version, config_updates)
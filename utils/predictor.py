@@ -1,57 +1,404 @@
-import torch
-import torchvision.transforms as transforms
-import cv2
-import numpy as np
-from PIL import Image
+import os
 import sys
+import threading
+from collections import OrderedDict
 from pathlib import Path
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from models.model import ImageClassifier
+from config import (MODEL_CACHE_SIZE, TTA_VIEWS, TTA_AGGREGATION, USE_MMAP_WEIGHTS,
+                    EXPLANATION_CACHE_SIZE)
+from utils.metrics import PREDICT_STAGE_SECONDS, MODEL_CACHE_HITS, MODEL_CACHE_MISSES
 
-def predict_image(image, model_path, class_labels):
+# torch, torchvision, cv2 and PIL are imported inside the functions that use
+# them, so importing this module (and app.py) stays cheap.
+
+# Loaded models keyed by (path, num_classes, device); the file's mtime is
+# stored alongside so a retrained model.pth is picked up automatically.
+# When a model.safetensors sits next to model.pth its weights are
+# memory-mapped instead, so every worker process shares one physical copy.
+_model_cache = OrderedDict()
+_model_cache_lock = threading.Lock()
+
+_transforms = {}
+
+# Grad-CAM results keyed by (image content hash, model fingerprint, target
+# class), so repeated explanations of an image skip the model entirely.
+_explanation_cache = OrderedDict()
+_explanation_cache_lock = threading.Lock()
+
+# Test-time augmentation views. Crops are 128x128 windows of the image
+# resized to TTA_CROP_RESIZE, given as (top, left) offsets.
+TTA_CROP_RESIZE = 144
+_TTA_CROPS = {
+    'center_crop': (8, 8),
+    'top_left': (0, 0),
+    'top_right': (0, 16),
+    'bottom_left': (16, 0),
+    'bottom_right': (16, 16),
+}
+AVAILABLE_TTA_VIEWS = ('identity', 'hflip') + tuple(_TTA_CROPS)
+AVAILABLE_TTA_AGGREGATIONS = ('mean', 'max', 'geometric')
+
+def _get_transform(size=128):
+    if size not in _transforms:
+        import torchvision.transforms as transforms
+
+        # Define image transformations
+        _transforms[size] = transforms.Compose([
+            transforms.Resize((size, size)),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
+        ])
+    return _transforms[size]
+
+def get_device():
+    """Device predictions run on"""
+    import torch
+
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+def mmap_weights_path(model_path):
+    """The memory-mappable copy of model_path's weights, or None if not used"""
+    path = os.path.splitext(model_path)[0] + '.safetensors'
+    if USE_MMAP_WEIGHTS and os.path.exists(path):
+        return path
+    return None
+
+def get_model(model_path, num_classes, device=None):
+    """
+    Return a model in evaluation mode, loading it from disk only when it is
+    not cached or the file changed since it was cached.
+
+    Args:
+        model_path: Path to the trained model
+        num_classes: Number of output classes
+        device: Device to load onto (default: get_device())
+
+    Returns:
+        ImageClassifier in evaluation mode
+    """
+    device = device or get_device()
+    key = (os.path.abspath(model_path), num_classes, str(device))
+    mmap_path = mmap_weights_path(model_path)
+    mtime = os.path.getmtime(mmap_path or model_path)
+
+    with _model_cache_lock:
+        cached = _model_cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            _model_cache.move_to_end(key)
+            MODEL_CACHE_HITS.inc(backend=device.type)
+            return cached[1]
+
+    import torch
+    from models.model import ImageClassifier, load_model_mmap
+
+    MODEL_CACHE_MISSES.inc(backend=device.type)
+    if mmap_path:
+        # Copies only when moving to a GPU; on CPU the weights stay mapped
+        model = load_model_mmap(mmap_path, num_classes).to(device)
+    else:
+        model = ImageClassifier(num_classes=num_classes).to(device)
+        model.load_state_dict(torch.load(model_path, map_location=device, weights_only=True))
+        model.eval()
+
+    with _model_cache_lock:
+        _model_cache[key] = (mtime, model)
+        _model_cache.move_to_end(key)
+        while len(_model_cache) > MODEL_CACHE_SIZE:
+            _model_cache.popitem(last=False)
+
+    return model
+
+def preprocess(image):
+    """
+    Convert an OpenCV image (BGR) to a normalized 1x3x128x128 tensor.
+    """
+    # Transform and add batch dimension
+    return _get_transform()(_to_pil(image)).unsqueeze(0)
+
+def _to_pil(image):
+    import cv2
+    from PIL import Image
+
+    # Convert BGR to RGB
+    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return Image.fromarray(image_rgb)
+
+def build_tta_batch(image, views=None):
+    """
+    Build every test-time augmentation view of an image as one tensor batch.
+
+    Args:
+        image: OpenCV image (BGR format)
+        views: View names from AVAILABLE_TTA_VIEWS (default: TTA_VIEWS)
+
+    Returns:
+        Tensor of shape (len(views), 3, 128, 128)
+    """
+    import torch
+
+    views = views or TTA_VIEWS
+    unknown = [v for v in views if v not in AVAILABLE_TTA_VIEWS]
+    if unknown:
+        raise ValueError(f"Unknown TTA view(s): {', '.join(unknown)}")
+
+    image_pil = _to_pil(image)
+    base = _get_transform()(image_pil)
+    large = None
+    batch = []
+    for view in views:
+        if view == 'identity':
+            batch.append(base)
+        elif view == 'hflip':
+            batch.append(base.flip(-1))
+        else:
+            if large is None:
+                large = _get_transform(TTA_CROP_RESIZE)(image_pil)
+            top, left = _TTA_CROPS[view]
+            batch.append(large[:, top:top + 128, left:left + 128])
+    return torch.stack(batch)
+
+def aggregate_probabilities(probabilities, aggregation=None):
+    """
+    Combine per-view class probabilities into one distribution.
+
+    Args:
+        probabilities: Tensor of shape (views, classes)
+        aggregation: 'mean', 'max' (per-class maximum, renormalised) or
+            'geometric' (mean of log-probabilities, renormalised)
+
+    Returns:
+        Tensor of shape (classes,)
+    """
+    import torch
+
+    aggregation = aggregation or TTA_AGGREGATION
+    if aggregation == 'mean':
+        return probabilities.mean(dim=0)
+    if aggregation == 'max':
+        combined = probabilities.max(dim=0).values
+        return combined / combined.sum()
+    if aggregation == 'geometric':
+        return torch.softmax(torch.log(probabilities.clamp_min(1e-12)).mean(dim=0), dim=0)
+    raise ValueError(f"Unknown TTA aggregation: {aggregation}")
+
+def predict_image(image, model_path, class_labels, project='', tta=None, aggregation=None):
     """
     Make a prediction on an image using a trained model.
-    
+
     Args:
         image: OpenCV image (BGR format)
         model_path: Path to the trained model
         class_labels: List of class names
-    
+        project: Project name, used to label the stage timings
+        tta: Test-time augmentation views (list of names, or True for
+            TTA_VIEWS). All views run as a single batched forward pass.
+        aggregation: How view probabilities are combined (see
+            aggregate_probabilities)
+
     Returns:
         tuple: (predicted_class, confidence_scores)
     """
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    
+    import torch
+
+    device = get_device()
+    labels = {'project': project, 'backend': device.type}
+
     # Load model
-    num_classes = len(class_labels)
-    model = ImageClassifier(num_classes=num_classes).to(device)
-    model.load_state_dict(torch.load(model_path, map_location=device))
-    model.eval()
-    
-    # Define image transformations
-    transform = transforms.Compose([
-        transforms.Resize((128, 128)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
-    ])
-    
-    # Convert BGR to RGB
-    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    image_pil = Image.fromarray(image_rgb)
-    
-    # Transform and add batch dimension
-    image_tensor = transform(image_pil).unsqueeze(0).to(device)
-    
+    with PREDICT_STAGE_SECONDS.time(stage='model_load', **labels):
+        model = get_model(model_path, len(class_labels), device)
+
+    with PREDICT_STAGE_SECONDS.time(stage='preprocess', **labels):
+        if tta:
+            image_tensor = build_tta_batch(image, None if tta is True else tta).to(device)
+        else:
+            image_tensor = preprocess(image).to(device)
+
     # Make prediction
-    with torch.no_grad():
+    with PREDICT_STAGE_SECONDS.time(stage='forward', **labels), torch.no_grad():
         outputs = model(image_tensor)
         probabilities = torch.nn.functional.softmax(outputs, dim=1)
+        if tta:
+            probabilities = aggregate_probabilities(probabilities, aggregation).unsqueeze(0)
         confidence, predicted = torch.max(probabilities, 1)
-        
+
         predicted_class = class_labels[predicted.item()]
         all_confidences = probabilities[0].cpu().numpy()
-    
+
     return predicted_class, all_confidences
+
+def predict_ensemble(image, model_paths, class_labels, project='', tta=None, aggregation=None):
+    """
+    Predict with several model versions and average their probabilities.
+
+    The input batch (including any TTA views) is built once, then every
+    version runs one batched forward pass over it.
+
+    Args:
+        image: OpenCV image (BGR format)
+        model_paths: Dict of version -> model path; all versions must
+            share class_labels
+        class_labels: List of class names
+        project: Project name, used to label the stage timings
+        tta: Test-time augmentation views, as for predict_image
+        aggregation: How view probabilities are combined
+
+    Returns:
+        tuple: (predicted_class, confidence_scores,
+                {version: (confidence_scores, forward seconds)})
+    """
+    import time
+    import torch
+
+    device = get_device()
+    labels = {'project': project, 'backend': device.type}
+
+    with PREDICT_STAGE_SECONDS.time(stage='preprocess', **labels):
+        if tta:
+            image_tensor = build_tta_batch(image, None if tta is True else tta).to(device)
+        else:
+            image_tensor = preprocess(image).to(device)
+
+    per_version = {}
+    for version, model_path in model_paths.items():
+        with PREDICT_STAGE_SECONDS.time(stage='model_load', **labels):
+            model = get_model(model_path, len(class_labels), device)
+
+        start = time.perf_counter()
+        with PREDICT_STAGE_SECONDS.time(stage='forward', **labels), torch.no_grad():
+            probabilities = torch.nn.functional.softmax(model(image_tensor), dim=1)
+            if tta:
+                probabilities = aggregate_probabilities(probabilities, aggregation).unsqueeze(0)
+        per_version[version] = (probabilities[0].cpu().numpy(), time.perf_counter() - start)
+
+    combined = sum(probs for probs, _ in per_version.values()) / len(per_version)
+    return class_labels[int(combined.argmax())], combined, per_version
+
+def predict_batch(images, model_path, num_classes):
+    """
+    Class probabilities for a batch of images in one forward pass.
+
+    Args:
+        images: PIL images
+        model_path: Path to the trained model
+        num_classes: Number of output classes
+
+    Returns:
+        numpy array of shape (len(images), num_classes)
+    """
+    import torch
+
+    device = get_device()
+    model = get_model(model_path, num_classes, device)
+    transform = _get_transform()
+    batch = torch.stack([transform(image.convert('RGB')) for image in images]).to(device)
+    with torch.no_grad():
+        return torch.nn.functional.softmax(model(batch), dim=1).cpu().numpy()
+
+def explain_batch(images, model_path, num_classes, image_keys=None, target_classes=None):
+    """
+    Class probabilities and Grad-CAM heatmaps (on conv3) for a batch.
+
+    Cached images are answered from the explanation cache; the rest share
+    one forward and one backward pass.
+
+    Args:
+        images: PIL images
+        model_path: Path to the trained model
+        num_classes: Number of output classes
+        image_keys: Content hash of each image, enabling the cache
+        target_classes: Class index to explain per image (default: the
+            predicted class)
+
+    Returns:
+        List of (probabilities numpy array, heatmap float array of shape
+        (128, 128) in [0, 1]) per image
+    """
+    import torch
+    from models.model import grad_cam
+    from utils.model_store import model_fingerprint
+
+    fingerprint = model_fingerprint(model_path)
+    targets = list(target_classes) if target_classes is not None else [None] * len(images)
+    keys = [(key, fingerprint, target) if key else None
+            for key, target in zip(image_keys or [None] * len(images), targets)]
+
+    results = [None] * len(images)
+    with _explanation_cache_lock:
+        for i, key in enumerate(keys):
+            if key in _explanation_cache:
+                _explanation_cache.move_to_end(key)
+                results[i] = _explanation_cache[key]
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        device = get_device()
+        model = get_model(model_path, num_classes, device)
+        transform = _get_transform()
+        batch = torch.stack([transform(images[i].convert('RGB')) for i in missing]).to(device)
+        explain = None
+        if target_classes is not None:
+            explain = [targets[i] for i in missing]
+        logits, heatmaps = grad_cam(model, batch, explain)
+        probabilities = torch.nn.functional.softmax(logits, dim=1).cpu().numpy()
+        heatmaps = heatmaps.cpu().numpy()
+
+        with _explanation_cache_lock:
+            for j, i in enumerate(missing):
+                results[i] = (probabilities[j], heatmaps[j])
+                if keys[i] is not None:
+                    _explanation_cache[keys[i]] = results[i]
+            while len(_explanation_cache) > EXPLANATION_CACHE_SIZE:
+                _explanation_cache.popitem(last=False)
+
+    return results
+
+def explain_image(image, model_path, class_labels, project='', image_key=None, target_class=None):
+    """
+    Predict on an image and explain the prediction with Grad-CAM, using the
+    same forward pass.
+
+    Args:
+        image: OpenCV image (BGR format)
+        model_path: Path to the trained model
+        class_labels: List of class names
+        project: Project name, used to label the stage timings
+        image_key: Content hash of the encoded image, enabling the cache
+        target_class: Class index to explain (default: the predicted class)
+
+    Returns:
+        tuple: (predicted_class, confidence_scores, heatmap)
+    """
+    device = get_device()
+    with PREDICT_STAGE_SECONDS.time(stage='explain', project=project, backend=device.type):
+        probabilities, heatmap = explain_batch(
+            [_to_pil(image)], model_path, len(class_labels), [image_key],
+            None if target_class is None else [target_class])[0]
+    return class_labels[int(probabilities.argmax())], probabilities, heatmap
+
+def encode_heatmap(heatmap):
+    """Render a [0, 1] heatmap as a color-mapped PNG data URL"""
+    import base64
+    import cv2
+    import numpy as np
+
+    colored = cv2.applyColorMap(np.uint8(np.clip(heatmap, 0, 1) * 255), cv2.COLORMAP_JET)
+    ok, png = cv2.imencode('.png', colored)
+    if not ok:
+        raise ValueError("Could not encode heatmap")
+    return 'data:image/png;base64,' + base64.b64encode(png.tobytes()).decode('ascii')
+
+def warm_up(model_path, num_classes):
+    """
+    Load a model into the cache and run one dummy forward pass, so the
+    first real request does not pay for imports, weight loading and
+    kernel initialisation.
+    """
+    import torch
+
+    device = get_device()
+    model = get_model(model_path, num_classes, device)
+    with torch.no_grad():
+        model(torch.zeros(1, 3, 128, 128, device=device))
@@ -0,0 +1,68 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+def make_synthetic_dataset(dataset_dir, num_classes=2, images_per_class=50,
+                           image_size=(128, 128), seed=0):
+    """
+    Generate a learnable synthetic ImageFolder dataset.
+
+    Every class gets its own base colour plus per-image noise, so a model
+    can separate the classes within a few epochs.
+
+    Args:
+        dataset_dir: Directory to write the class folders into
+        num_classes: Number of classes to generate
+        images_per_class: Number of images per class
+        image_size: (width, height) of the generated images
+        seed: Random seed
+
+    Returns:
+        List of class names
+    """
+    rng = np.random.default_rng(seed)
+    width, height = image_size
+    class_names = [f"class_{i:02d}" for i in range(num_classes)]
+
+    for class_name in class_names:
+        class_dir = os.path.join(dataset_dir, class_name)
+        os.makedirs(class_dir, exist_ok=True)
+        base_colour = rng.integers(0, 256, size=3)
+        for j in range(images_per_class):
+            noise = rng.normal(0, 40, size=(height, width, 3))
+            pixels = np.clip(base_colour + noise, 0, 255).astype(np.uint8)
+            Image.fromarray(pixels).save(os.path.join(class_dir, f"{j:05d}.png"))
+
+    return class_names
+
+def make_synthetic_project(project_name, num_classes=2, images_per_class=50,
+                           image_size=(128, 128), seed=0, projects_dir='projects'):
+    """
+    Create a project with a synthetic dataset, laid out like /api/create_project does.
+
+    Returns:
+        Path to the project directory
+    """
+    project_dir = os.path.join(projects_dir, project_name)
+    os.makedirs(os.path.join(project_dir, 'models'), exist_ok=True)
+    class_names = make_synthetic_dataset(os.path.join(project_dir, 'dataset'), num_classes,
+                                         images_per_class, image_size, seed)
+
+    config = {
+        "name": project_name,
+        "description": "Synthetic dataset",
+        "created_at": datetime.now().isoformat(),
+        "num_classes": num_classes,
+        "classes": class_names,
+        "class_counts": {name: images_per_class for name in class_names},
+        "trained": False,
+        "model_path": None,
+        "training_history": []
+    }
+    with open(os.path.join(project_dir, 'config.json'), 'w') as f:
+        json.dump(config, f, indent=2)
+
+    return project_dir